@@ -0,0 +1,101 @@
+#Benchmark suite ---> times each stage of the pipeline (parsing, cleaning, writing the
+#dataset and the viewer's time-series plot) on synthetic corpora of growing size and
+#reports throughput and peak memory. The corpus is generated once for the largest size,
+#smaller sizes use its first files.
+#   python benchmarks.py --sizes 1000 10000 100000 --output results.csv
+import os
+import glob
+import time
+import argparse
+import tempfile
+import tracemalloc
+import pandas as pd
+from utils import parse_multiple_files, clean_dataframe
+from dataset import save_dataset
+from synthetic_corpus import generate_corpus
+
+default_sizes = [1000, 10000, 100000]
+qt_app = None
+
+def corpus_files(directory, count):
+    filenames = sorted(glob.glob(os.path.join(directory, '*.xml')))
+    if len(filenames) < count:
+        #Same seed ---> the files already there are rewritten identically
+        filenames = generate_corpus(directory, count)
+    return filenames[:count]
+
+#Runs stage once for the timings and, if memory is set, a second time under tracemalloc
+#(which slows it down) for the peak of the Python/numpy allocations
+def measure(stage, *args, memory=True):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = stage(*args)
+    wall, cpu = time.perf_counter()-wall, time.process_time()-cpu
+    peak = None
+    if memory:
+        tracemalloc.start()
+        stage(*args)
+        peak = tracemalloc.get_traced_memory()[1]/2**20
+        tracemalloc.stop()
+    return result, {'seconds': wall, 'cpu_seconds': cpu, 'peak_mb': peak}
+
+#Builds the viewer offscreen and returns the plot callable, None without PyQt5
+def plot_stage(filename, patients=5):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5 import QtWidgets
+        import viewer
+    except ImportError:
+        return None
+    global qt_app
+    qt_app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = viewer.SecondWindow(filename)
+    window.feature_checkbox[0].setChecked(True)
+    for checkbox in window.test_checkbox:
+        checkbox.setChecked(checkbox.text() == 'BLOOD')
+    patient_ids = list(window.unique_ids[:patients])
+    return lambda: window.filtered_plot(window.dataframe, patient_ids)
+
+def run_size(filenames, output_dir, workers=1, memory=True, dataset_format='csv'):
+    results = []
+    def record(stage, stats, rows):
+        stats.update({'files': len(filenames), 'stage': stage, 'rows': rows,
+                      'files_per_s': len(filenames)/stats['seconds'] if stats['seconds'] else None})
+        results.append(stats)
+        print('{:>7} files  {:<6} {:8.3f} s  {}'.format(len(filenames), stage, stats['seconds'],
+              '' if stats['peak_mb'] is None else '{:.1f} MB'.format(stats['peak_mb'])))
+
+    raw_df, stats = measure(lambda: parse_multiple_files(filenames, workers=workers), memory=memory)
+    record('parse', stats, len(raw_df))
+    clean_df, stats = measure(clean_dataframe, raw_df, memory=memory)
+    record('clean', stats, len(clean_df))
+    filename = os.path.join(output_dir, 'benchmark_{}.{}'.format(len(filenames), dataset_format))
+    _, stats = measure(save_dataset, clean_df, filename, memory=memory)
+    record('write', stats, len(clean_df))
+    plot = plot_stage(filename)
+    if plot is None:
+        print('{:>7} files  plot   skipped (PyQt5 is not installed)'.format(len(filenames)))
+    else:
+        _, stats = measure(plot, memory=memory)
+        record('plot', stats, len(clean_df))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the parsing/cleaning/plotting pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes)
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'bas_corpus'))
+    parser.add_argument('--workers', type=int, default=1, help='parse_multiple_files workers (0 for all cores)')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--output', help='csv file for the results')
+    args = parser.parse_args()
+
+    filenames = corpus_files(args.corpus, max(args.sizes))
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for size in sorted(args.sizes):
+            results.extend(run_size(filenames[:size], output_dir, args.workers or None,
+                                    not args.no_memory, args.format))
+    results = pd.DataFrame(results, columns=['files', 'stage', 'rows', 'seconds', 'cpu_seconds', 'files_per_s', 'peak_mb'])
+    print(results.to_string(index=False, float_format='{:.3f}'.format))
+    if args.output:
+        results.to_csv(args.output, index=False)
@@ -0,0 +1,18 @@
+#Matplotlib canvas of the viewer. Importing matplotlib and its Qt backend takes a good part
+#of a cold start, so this module is only imported when the first plot is drawn.
+import matplotlib
+import matplotlib.style
+from matplotlib.backends.backend_qtagg import (
+    FigureCanvasQTAgg, NavigationToolbar2QT as NavigationToolbar)
+from matplotlib.figure import Figure
+matplotlib.style.use('ggplot')
+matplotlib.rcParams['axes.xmargin'] = 0
+matplotlib.rcParams['axes.ymargin'] = 0
+#matplotlib.rcParams['figure.constrained_layout.use'] = True
+
+#Class wrapper for Canvas and Plotting Capabilities
+class MplCanvas(FigureCanvasQTAgg):
+    def __init__(self, parent=None, width=12, height=9, dpi=100):
+        self.fig = Figure(figsize=(width, height), dpi=dpi)
+        self.axs = []
+        super().__init__(self.fig)
@@ -1,3 +1,4 @@
+import sys
 from utils import *
 import numpy as np
 
@@ -0,0 +1,230 @@
+#Dataset storage ---> the cleaned data can be kept as csv (default, also the export format),
+#as a columnar Parquet file with an explicit schema, which allows reading a subset of
+#the columns (e.g. everything but the histogram and threshold strings), or as an indexed
+#SQLite database (sqlite_store.py) that selections read without loading the rest
+import os
+import numpy as np
+import pandas as pd
+from manifest import drop_samples
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+dataset_filters = "Datasets (*.csv *.parquet *.sqlite *.db);;Comma-separated values (*.csv);;Parquet dataset (*.parquet);;SQLite database (*.sqlite *.db)"
+
+numeric_suffixes = ('_Value', '_LowLimit', '_HighLimit')
+numeric_columns = ['TEMPERATURE']
+categorical_columns = ['FIELD_SID_PATIENT_ID', 'FIELD_SID_OWNER_LASTNAME', 'FIELD_SID_ANIMAL_NAME']
+date_columns = ['ANALYSIS_DATE']
+integer_columns = ['HIST_INDEX']
+#Format written by the analyser, then the one of csv exports that went through Excel
+date_format = '%Y/%m/%d %H:%M:%S'
+date_formats = [date_format, '%d-%m-%y %H:%M']
+
+def is_parquet(filename):
+    return os.path.splitext(filename)[1].lower() == '.parquet'
+
+def is_sqlite(filename):
+    return os.path.splitext(filename)[1].lower() in ('.sqlite', '.sqlite3', '.db')
+
+def require_parquet():
+    if pq is None:
+        raise ImportError('Parquet datasets need the pyarrow package (pip install pyarrow)')
+
+def is_numeric_column(column):
+    return column.endswith(numeric_suffixes) or column in numeric_columns
+
+def is_payload_column(column):
+    return 'HISTOGRAM' in column or 'THRESHOLDS' in column
+
+#Columns needed by the viewer, the histogram/threshold payloads are left on disk
+def viewer_columns(columns):
+    return [column for column in columns if not is_payload_column(column)]
+
+#Measurements as float32, ids/owner/sample type as categories, ANALYSIS_DATE as a
+#timestamp, everything else as text
+def column_dtype(column):
+    if is_numeric_column(column):
+        return 'float32'
+    if column in categorical_columns:
+        return 'category'
+    if column in date_columns:
+        return 'datetime64[ns]'
+    if column in integer_columns:
+        return 'Int64'
+    return 'object'
+
+def dataset_schema(columns):
+    require_parquet()
+    types = {'float32': pa.float32(), 'category': pa.dictionary(pa.int32(), pa.string()),
+             'datetime64[ns]': pa.timestamp('ns'), 'Int64': pa.int64(), 'object': pa.string()}
+    return pa.schema([(column, types[column_dtype(column)]) for column in columns])
+
+def parse_dates(values):
+    dates = pd.to_datetime(values, format=date_format, errors='coerce')
+    for extra_format in date_formats[1:]:
+        missing = dates.isna() & values.notna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(values[missing], format=extra_format, errors='coerce')
+    return dates
+
+def as_text(values):
+    return values.where(values.isna(), values.astype(str)).astype(object)
+
+#Empty text is a missing value, as csv and SQLite datasets read it back
+def blank_to_missing(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.remove_categories('') if '' in values.cat.categories else values
+    blank = values == ''
+    return values.mask(blank) if blank.any() else values
+
+#Casts every column to its column_dtype, columns already in the right dtype are kept as is
+def apply_schema(dataframe):
+    dataframe = dataframe.copy()
+    for column in dataframe.columns:
+        dtype, values = column_dtype(column), dataframe[column]
+        if dtype in ('category', 'object'):
+            values = dataframe[column] = blank_to_missing(values)
+        if str(values.dtype) == dtype or (dtype.startswith('datetime') and pd.api.types.is_datetime64_any_dtype(values)):
+            continue
+        if dtype == 'float32':
+            dataframe[column] = pd.to_numeric(values, errors='coerce').astype('float32')
+        elif dtype == 'category':
+            dataframe[column] = as_text(values).astype('category')
+        elif dtype == 'datetime64[ns]':
+            dataframe[column] = parse_dates(values)
+        elif dtype == 'Int64':
+            dataframe[column] = pd.to_numeric(values, errors='coerce').astype('Int64')
+        else:
+            dataframe[column] = as_text(values)
+    return dataframe
+
+#(patient id, sample type) ---> row positions, so selections only touch the selected rows
+def sample_index(dataframe):
+    return dataframe.groupby(['FIELD_SID_PATIENT_ID', 'FIELD_SID_ANIMAL_NAME'], observed=True, sort=False).indices
+
+#Positions of the samples of patient_ids for one sample type, in dataframe order
+def sample_rows(index, patient_ids, sample_type):
+    rows = [index.get((str(patient), sample_type)) for patient in patient_ids]
+    rows = [positions for positions in rows if positions is not None]
+    return np.sort(np.concatenate(rows)) if rows else np.array([], dtype=np.intp)
+
+def dataset_columns(filename):
+    if is_sqlite(filename):
+        from sqlite_store import sqlite_columns
+        return sqlite_columns(filename)
+    if is_parquet(filename):
+        require_parquet()
+        return pq.read_schema(filename).names
+    return pd.read_csv(filename, nrows=0).columns.tolist()
+
+def load_dataset(filename, columns=None):
+    if is_sqlite(filename):
+        from sqlite_store import load_sqlite
+        return load_sqlite(filename, columns)
+    if is_parquet(filename):
+        require_parquet()
+        return apply_schema(pq.read_table(filename, columns=columns).to_pandas())
+    header = columns if columns is not None else dataset_columns(filename)
+    #Text columns are read as written (ids like '007' are not numbers), only empty values
+    #are missing, like merge_dataset reads them
+    dtypes = {column: str if column_dtype(column) == 'object' else column_dtype(column)
+              for column in header if column_dtype(column) in ('float32', 'category', 'object')}
+    try:
+        dataframe = pd.read_csv(filename, usecols=columns, dtype=dtypes, keep_default_na=False, na_values=[''])
+    except ValueError:
+        #Values that are not numbers (e.g. '--.--') ---> read as text and coerce to NaN
+        dataframe = pd.read_csv(filename, usecols=columns, dtype=str, keep_default_na=False, na_values=[''])
+    return apply_schema(dataframe)
+
+def save_dataset(dataframe, filename):
+    if is_sqlite(filename):
+        from sqlite_store import save_sqlite
+        save_sqlite(dataframe, filename)
+    elif is_parquet(filename):
+        dataframe = apply_schema(dataframe)
+        table = pa.Table.from_pandas(dataframe, schema=dataset_schema(dataframe.columns), preserve_index=False)
+        pq.write_table(table, filename)
+    else:
+        dataframe.to_csv(filename, index=False)
+
+#Adds new rows to an existing dataset, removing the rows of re-exported files first
+def merge_dataset(new_df, filename, stale=()):
+    if is_sqlite(filename):
+        return append_dataset(new_df, filename, stale)
+    if os.path.exists(filename):
+        if is_parquet(filename):
+            old_df = load_dataset(filename)
+        else:
+            #Read as text so the existing values are written back untouched
+            old_df = pd.read_csv(filename, dtype=str, keep_default_na=False)
+        new_df = pd.concat([drop_samples(old_df, stale), new_df], ignore_index=True)
+    save_dataset(new_df, filename)
+
+#Csv header gained columns ---> the existing rows are copied chunk by chunk under the new
+#header (filled with empty values), later appends only write their own rows
+def extend_csv_header(filename, header, chunk_size=50000):
+    temp_path = filename+'.'+str(os.getpid())
+    pd.DataFrame(columns=header).to_csv(temp_path, index=False)
+    for chunk in pd.read_csv(filename, dtype=str, keep_default_na=False, chunksize=chunk_size):
+        chunk.reindex(columns=header, fill_value='').to_csv(temp_path, mode='a', header=False, index=False)
+    os.replace(temp_path, filename)
+
+#Removes the rows of re-exported files, a csv dataset is rewritten chunk by chunk
+def drop_dataset_samples(filename, samples, chunk_size=50000):
+    if not samples or not os.path.exists(filename):
+        return
+    if is_sqlite(filename):
+        from sqlite_store import drop_sqlite_samples
+        return drop_sqlite_samples(filename, samples)
+    if is_parquet(filename):
+        return save_dataset(drop_samples(load_dataset(filename), samples), filename)
+    temp_path = filename+'.'+str(os.getpid())
+    pd.DataFrame(columns=dataset_columns(filename)).to_csv(temp_path, index=False)
+    for chunk in pd.read_csv(filename, dtype=str, keep_default_na=False, chunksize=chunk_size):
+        drop_samples(chunk, samples).to_csv(temp_path, mode='a', header=False, index=False)
+    os.replace(temp_path, filename)
+
+#Writes only the new rows at the end of a csv dataset. Rewriting is left to merge_dataset
+#when rows are replaced (stale) and for parquet files, which cannot be appended to. SQLite
+#datasets delete the replaced rows and insert the new ones in one transaction.
+def append_dataset(new_df, filename, stale=()):
+    if is_sqlite(filename):
+        from sqlite_store import append_sqlite
+        return append_sqlite(new_df, filename, stale)
+    if stale or is_parquet(filename) or not os.path.exists(filename):
+        return merge_dataset(new_df, filename, stale)
+    header = dataset_columns(filename)
+    extra = [column for column in new_df.columns if column not in header]
+    if extra:
+        header = header+extra
+        extend_csv_header(filename, header)
+    with open(filename, 'rb+') as fh:
+        fh.seek(0, os.SEEK_END)
+        if fh.tell():
+            fh.seek(-1, os.SEEK_END)
+            if fh.read(1) not in b'\r\n':
+                fh.write(b'\n')
+    new_df.reindex(columns=header).to_csv(filename, mode='a', header=False, index=False)
+
+#Adds rows to a typed dataframe, categories are unified first so the columns stay
+#categorical and only the columns of the new rows need converting
+def append_rows(dataframe, new_df):
+    new_df = apply_schema(new_df)
+    for column in categorical_columns:
+        if column in dataframe and column in new_df:
+            categories = dataframe[column].cat.categories.union(new_df[column].cat.categories)
+            dataframe[column] = dataframe[column].cat.set_categories(categories)
+            new_df[column] = new_df[column].cat.set_categories(categories)
+    return apply_schema(pd.concat([dataframe, new_df], ignore_index=True))
+
+#Adds the positions of rows appended after offset existing rows to an index
+def extend_sample_index(index, new_df, offset):
+    for key, positions in sample_index(new_df).items():
+        positions = positions+offset
+        index[key] = np.concatenate([index[key], positions]) if key in index else positions
+    return index
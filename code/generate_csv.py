@@ -1,15 +1,77 @@
-from utils import *
+#Command line version of "Generate new csv file(s)", for scheduled jobs on machines without
+#a display (no PyQt needed). Inputs are directories (their *.xml files), files or glob
+#patterns, the output name gets the owner suffix like in the GUI and its extension picks
+#the format (.csv, .parquet or .sqlite). Files already in the output's manifest are skipped.
+#   python generate_csv.py /data/results-2023-* exports/study.csv --workers 8
+#--memory-budget MB parses, cleans and writes the files in chunks that fit in about that much
+#memory (same datasets as a single pass), for exports larger than the machine's RAM.
+#--profile writes the profiling spans of the run (json or csv, by extension).
+#Exit codes: 0 done (also when nothing was new), 1 failed, 2 bad arguments, 3 no xml files
+import os
+import sys
+import glob
+import json
+import argparse
+import profiling
+from ingest import export_files, export_files_chunked
 
-directory = sys.argv[-2]
+def input_files(inputs):
+    filenames = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = [os.path.join(item, file) for file in os.listdir(item) if file.lower().endswith('.xml')]
+        else:
+            matches = glob.glob(item, recursive=True)
+        filenames.update(os.path.abspath(match) for match in matches if os.path.isfile(match))
+    return sorted(filenames)
 
-output_name = sys.argv[-1]
+def print_summary(summary):
+    print('{} xml files, {} new or changed, {} parsed rows, {} after cleaning{}'.format(
+          summary.get('files', 0), summary.get('pending', 0), summary.get('rows', 0), summary.get('clean_rows', 0),
+          ', {} chunks'.format(summary['chunks']) if 'chunks' in summary else ''))
+    if summary.get('duplicates'):
+        print('  {} samples already in the datasets skipped'.format(summary['duplicates']))
+    for stage, seconds in summary.get('seconds', dict()).items():
+        print('  {:<6} {:8.3f} s'.format(stage, seconds))
+    for output, rows in summary.get('outputs', dict()).items():
+        print('  {} rows ---> {}'.format(rows, output))
 
-filenames = os.listdir(directory)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse and clean analyser xml files into per-owner datasets')
+    parser.add_argument('inputs', nargs='+', help='directories, xml files or glob patterns')
+    parser.add_argument('output', help='output dataset name (.csv, .parquet or .sqlite)')
+    parser.add_argument('--workers', type=int, default=0, help='parsing processes (0 for all cores, 1 to parse in this process)')
+    parser.add_argument('--summary', help='also write the summary as json to this file')
+    parser.add_argument('--memory-budget', type=int, metavar='MB', help='work in chunks that fit in about MB of memory')
+    parser.add_argument('--profile', help='write the profiling spans to this file (.json or .csv)')
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable()
 
-raw_df = parse_multiple_files(directory)
+    filenames = input_files(args.inputs)
+    if not filenames:
+        print('No xml files found in', ' '.join(args.inputs), file=sys.stderr)
+        return 3
+    summary = dict()
+    try:
+        with profiling.span('export', files=len(filenames)):
+            if args.memory_budget:
+                export_files_chunked(filenames, os.path.abspath(args.output), workers=args.workers or None,
+                                     summary=summary, memory_budget=args.memory_budget)
+            else:
+                export_files(filenames, os.path.abspath(args.output), workers=args.workers or None, summary=summary)
+    except Exception as error:
+        print('Failed: {}: {}'.format(type(error).__name__, error), file=sys.stderr)
+        print_summary(summary)
+        return 1
+    finally:
+        if args.profile:
+            profiling.export(args.profile)
+    print_summary(summary)
+    if args.summary:
+        with open(args.summary, 'w') as fh:
+            json.dump(summary, fh, indent=1)
+    return 0
 
-clean_df = clean_dataframe(raw_df)
-
-#out_file = os.path.join('\\'.join(root_dir.split('\\')[:-1]), 'tests', output_name)
-
-clean_df.to_csv(output_name)
+if __name__ == '__main__':
+    sys.exit(main())
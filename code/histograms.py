@@ -0,0 +1,124 @@
+#Histogram store ---> the ';'-separated *_HISTOGRAM_SampleHistogram strings are decoded
+#into fixed-width integer arrays, one raw file per histogram column next to the dataset.
+#The dataset only keeps HIST_INDEX, the row of each sample inside the store, so single
+#histograms or batches of them are read through a memory map without loading the rest.
+import os
+import re
+import json
+import logging
+import numpy as np
+
+hist_dtype = np.uint16
+index_column = 'HIST_INDEX'
+log = logging.getLogger(__name__)
+
+def is_histogram_column(column):
+    return 'HISTOGRAM' in column
+
+def histogram_store_path(filename):
+    return os.path.splitext(filename)[0]+'_histograms'
+
+#Missing histograms are stored as empty (all zero) rows, so are the ones with a bin that is
+#negative, not an integer or too large for hist_dtype, with a warning instead of failing the
+#whole batch
+def decode_histograms(values, bins=0):
+    rows = [value.rstrip(';').split(';') if isinstance(value, str) and value.strip(';') else [] for value in values]
+    bins = max([bins]+[len(row) for row in rows])
+    out = np.zeros((len(rows), bins), dtype=hist_dtype)
+    invalid = []
+    for idx, row in enumerate(rows):
+        if row:
+            try:
+                out[idx, :len(row)] = row
+            except (ValueError, OverflowError):
+                out[idx] = 0
+                invalid.append(idx)
+    if invalid:
+        log.warning('%d histogram(s) with invalid bins stored empty (rows %s)', len(invalid),
+                    ', '.join(str(idx) for idx in invalid[:10])+(', ...' if len(invalid) > 10 else ''))
+    return out
+
+class HistogramStore:
+    def __init__(self, path):
+        self.path = path
+        self.info = {'rows': 0, 'columns': dict()}
+        try:
+            with open(os.path.join(self.path, 'store.json')) as fh:
+                self.info = json.load(fh)
+        except (OSError, ValueError):
+            pass
+        self.maps = dict()
+
+    @property
+    def rows(self):
+        return self.info['rows']
+
+    @property
+    def columns(self):
+        return list(self.info['columns'])
+
+    def column_file(self, column):
+        return os.path.join(self.path, self.info['columns'][column]['file'])
+
+    def memmap(self, column):
+        if column not in self.maps:
+            bins = self.info['columns'][column]['bins']
+            if self.rows and bins:
+                self.maps[column] = np.memmap(self.column_file(column), dtype=hist_dtype, mode='r', shape=(self.rows, bins))
+            else:
+                self.maps[column] = np.zeros((self.rows, bins), dtype=hist_dtype)
+        return self.maps[column]
+
+    def histogram(self, column, index):
+        return np.array(self.memmap(column)[int(index)])
+
+    def histograms(self, column, indices):
+        return self.memmap(column)[np.asarray(indices, dtype=np.int64)]
+
+    #Decodes the histogram columns of dataframe and appends them, returns the new row numbers
+    def append(self, dataframe):
+        os.makedirs(self.path, exist_ok=True)
+        self.maps = dict()
+        start, count = self.rows, len(dataframe)
+        columns = [column for column in dataframe.columns if is_histogram_column(column)]
+        for column in set(columns) | set(self.columns):
+            entry = self.info['columns'].get(column)
+            if entry is None:
+                entry = {'file': re.sub(r'[^\w.-]+', '_', column)+'.bin', 'bins': 0}
+                self.info['columns'][column] = entry
+                #Columns seen for the first time are empty for every previous sample
+                np.zeros((start, 0), dtype=hist_dtype).tofile(self.column_file(column))
+            values = dataframe[column].values if column in dataframe else [None]*count
+            block = decode_histograms(values, entry['bins'])
+            if block.shape[1] > entry['bins']:
+                self.widen(column, block.shape[1])
+            with open(self.column_file(column), 'ab') as fh:
+                block.tofile(fh)
+        self.info['rows'] = start+count
+        with open(os.path.join(self.path, 'store.json'), 'w') as fh:
+            json.dump(self.info, fh, indent=1)
+        return np.arange(start, start+count)
+
+    #A newer analyser version with more bins ---> rewrite the existing rows zero-padded
+    def widen(self, column, bins):
+        entry = self.info['columns'][column]
+        old = np.fromfile(self.column_file(column), dtype=hist_dtype)
+        old = old.reshape(self.rows, entry['bins']) if entry['bins'] else np.zeros((self.rows, 0), dtype=hist_dtype)
+        new = np.zeros((self.rows, bins), dtype=hist_dtype)
+        new[:, :old.shape[1]] = old
+        new.tofile(self.column_file(column))
+        entry['bins'] = bins
+
+#Moves the histogram strings of a cleaned dataframe into the store of dataset filename
+def store_histograms(dataframe, filename):
+    columns = [column for column in dataframe.columns if is_histogram_column(column)]
+    if not columns or dataframe.empty:
+        return dataframe.drop(columns=columns)
+    store = HistogramStore(histogram_store_path(filename))
+    indices = store.append(dataframe)
+    dataframe = dataframe.drop(columns=columns)
+    dataframe[index_column] = indices
+    return dataframe
+
+def open_histograms(filename):
+    return HistogramStore(histogram_store_path(filename))
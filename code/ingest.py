@@ -0,0 +1,262 @@
+#Ingest pipeline ---> manifest check, parsing, cleaning, histogram store and dataset write
+#for a set of xml files, without any Qt dependency so it can run in a worker thread or from
+#the command line (generate_csv.py).
+#progress is anything with setMaximum/setValue (e.g. a QProgressBar), setting its
+#cancelled attribute stops the pipeline at the next checkpoint. Once the outputs are
+#being written the pipeline is not interrupted anymore, so they always stay consistent.
+#summary, when given, is filled with the counts and the seconds spent in every stage. The
+#stages are also profiling spans, with their row and file counts.
+import os
+import time
+import shutil
+import tempfile
+import pandas as pd
+from collections import Counter
+from contextlib import contextmanager
+from utils import (parse_multiple_files, clean_dataframe, owner_filename, dropped_by_name,
+                   valid_rows, column_counts, kept_columns, clean_rows)
+from manifest import load_manifest, save_manifest, pending_files, stale_samples, record_files
+from dataset import viewer_columns, append_dataset, drop_dataset_samples
+from histograms import store_histograms
+from sample_keys import open_keys
+from profiling import span
+
+class IngestCancelled(Exception):
+    pass
+
+def checkpoint(progress):
+    if getattr(progress, 'cancelled', False):
+        raise IngestCancelled()
+
+@contextmanager
+def timed(summary, stage, **counts):
+    start = time.perf_counter()
+    try:
+        with span(stage, **counts) as counts:
+            yield counts
+    finally:
+        if summary is not None:
+            #Stages repeated per chunk add up
+            seconds = summary.setdefault('seconds', dict())
+            seconds[stage] = seconds.get(stage, 0)+time.perf_counter()-start
+
+#Parses and cleans the pending files, None when there is nothing new
+def parse_pending(filenames, manifest, progress=None, workers=None, summary=None):
+    with timed(summary, 'scan', files=len(filenames)) as counts:
+        pending = pending_files(filenames, manifest)
+        counts['pending'] = len(pending)
+    if summary is not None:
+        summary.update({'files': len(filenames), 'pending': len(pending), 'rows': 0, 'clean_rows': 0})
+    checkpoint(progress)
+    if not pending:
+        return pending, None
+    if progress is not None:
+        progress.setMaximum(len(pending))
+    with timed(summary, 'parse', files=len(pending)) as counts:
+        raw_df = parse_multiple_files([item['path'] for item in pending], progress, workers=workers)
+        counts['rows'] = len(raw_df)
+    checkpoint(progress)
+    with timed(summary, 'clean', rows=len(raw_df)) as counts:
+        clean_df = clean_dataframe(raw_df)
+        counts['clean_rows'] = len(clean_df)
+    checkpoint(progress)
+    if summary is not None:
+        summary.update({'rows': len(raw_df), 'clean_rows': len(clean_df)})
+    return pending, clean_df
+
+#Rows of new_df whose sample is not in the dataset of keys (its key index) yet
+def new_samples(new_df, keys):
+    with span('dedup', rows=len(new_df)) as counts:
+        new_df = new_df[keys.new_rows(new_df)]
+        counts['duplicates'] = counts['rows']-len(new_df)
+    return new_df
+
+#Appends the cleaned rows to one dataset per owner next to filename, stale maps the datasets
+#to the rows they lose. Samples already in a dataset are skipped. Returns the dataset of
+#every row written.
+def write_owners(clean_df, filename, stale=dict()):
+    with span('split', rows=len(clean_df)) as counts:
+        owner_dict = {owner_filename(filename, owner): owner_df for owner, owner_df in clean_df.groupby('FIELD_SID_OWNER_LASTNAME')}
+        counts['outputs'] = len(owner_dict)
+    keys = {subset_filename: open_keys(subset_filename) for subset_filename in set(owner_dict) | set(stale)}
+    #The keys of the replaced rows go first, a re-exported file brings its samples back
+    for subset_filename, samples in stale.items():
+        keys[subset_filename].drop(samples)
+    owner_dict = {subset_filename: new_samples(owner_df, keys[subset_filename]) for subset_filename, owner_df in owner_dict.items()}
+    owner_dict = {subset_filename: owner_df for subset_filename, owner_df in owner_dict.items() if len(owner_df)}
+    #Histogram strings are decoded into the array store of each output file
+    with span('histograms', rows=len(clean_df)):
+        owner_dict = {subset_filename: store_histograms(owner_df, subset_filename) for subset_filename, owner_df in owner_dict.items()}
+    for subset_filename in set(owner_dict) | set(stale):
+        owner_df = owner_dict.get(subset_filename, clean_df.iloc[:0])
+        with span('append', rows=len(owner_df)):
+            append_dataset(owner_df, subset_filename, stale.get(subset_filename, ()))
+        keys[subset_filename].add(owner_df)
+        keys[subset_filename].save()
+    return {idx: subset_filename for subset_filename, owner_df in owner_dict.items() for idx in owner_df.index}
+
+#New analysis ---> one dataset per owner next to filename, returns the cleaned rows
+def export_files(filenames, filename, progress=None, workers=None, summary=None):
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    manifest = load_manifest(filename)
+    pending, clean_df = parse_pending(filenames, manifest, progress, workers, summary)
+    outputs = dict()
+    with timed(summary, 'write'):
+        if clean_df is not None:
+            outputs = write_owners(clean_df, filename, stale_samples(pending))
+            with span('manifest', files=len(pending)):
+                record_files(manifest, pending, clean_df, outputs)
+        save_manifest(manifest, filename)
+    if summary is not None:
+        summary['outputs'] = dict(sorted(Counter(outputs.values()).items()))
+        summary['duplicates'] = 0 if clean_df is None else len(clean_df)-len(outputs)
+    return clean_df
+
+#Progress of the files of one chunk within the whole run
+class ChunkProgress:
+    def __init__(self, progress, offset):
+        self.progress = progress
+        self.offset = offset
+
+    def setValue(self, value):
+        self.progress.setValue(self.offset+value)
+
+#Chunked version of export_files for corpora that do not fit in memory. The pending files
+#are parsed in chunks sized to memory_budget (MB) and spooled to disk (spool_dir, next to
+#filename by default). What clean_dataframe decides from all the rows (the raw column that
+#marks failed measurements, the empty columns) is decided once every chunk is parsed, then
+#each chunk is cleaned with those decisions and appended, so the datasets are the same as
+#the ones export_files writes. The budget holds for csv datasets, parquet ones are
+#rewritten at every append. The manifest is saved after every chunk.
+def export_files_chunked(filenames, filename, progress=None, workers=None, summary=None,
+                         memory_budget=1024, spool_dir=None):
+    #The spool goes next to filename, so its folder is made before anything else
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    manifest = load_manifest(filename)
+    with timed(summary, 'scan', files=len(filenames)) as counts:
+        pending = pending_files(filenames, manifest)
+        counts['pending'] = len(pending)
+    if summary is not None:
+        summary.update({'files': len(filenames), 'pending': len(pending), 'rows': 0, 'clean_rows': 0, 'chunks': 0, 'duplicates': 0})
+    checkpoint(progress)
+    outputs = Counter()
+    if pending:
+        if progress is not None:
+            progress.setMaximum(len(pending))
+        spool = tempfile.mkdtemp(prefix='bas_chunks_', dir=spool_dir or os.path.dirname(os.path.abspath(filename)))
+        try:
+            chunks, raw_columns = parse_chunks(pending, spool, progress, workers, summary, memory_budget)
+            rows, columns = cleaning_decisions(chunks, raw_columns, summary)
+            #Rows of re-exported files are removed before any chunk is appended
+            with timed(summary, 'write'):
+                for subset_filename, samples in stale_samples(pending).items():
+                    drop_dataset_samples(subset_filename, samples)
+                    keys = open_keys(subset_filename)
+                    keys.drop(samples)
+                    keys.save()
+            for chunk_pending, path in chunks:
+                raw_df = pd.read_pickle(path)
+                with timed(summary, 'clean', rows=len(raw_df)) as counts:
+                    clean_df = clean_rows(raw_df, valid_rows(raw_df, rows), columns)
+                    counts['clean_rows'] = len(clean_df)
+                del raw_df
+                with timed(summary, 'write'):
+                    chunk_outputs = write_owners(clean_df, filename) if len(clean_df) else dict()
+                    with span('manifest', files=len(chunk_pending)):
+                        record_files(manifest, chunk_pending, clean_df, chunk_outputs)
+                    save_manifest(manifest, filename)
+                outputs.update(chunk_outputs.values())
+                if summary is not None:
+                    summary['clean_rows'] += len(clean_df)
+                    summary['duplicates'] += len(clean_df)-len(chunk_outputs)
+        finally:
+            shutil.rmtree(spool, ignore_errors=True)
+    save_manifest(manifest, filename)
+    if summary is not None:
+        summary['outputs'] = dict(sorted(outputs.items()))
+
+#Parses the pending files chunk by chunk into pickles in spool, the number of files per
+#chunk follows the memory the parsed files took so far. Returns the chunks as (pending
+#entries, pickle) and the raw columns that have a value, in the order they first appeared.
+def parse_chunks(pending, spool, progress, workers, summary, memory_budget, first_chunk=64):
+    chunks, raw_columns = [], dict()
+    start, size, file_bytes = 0, first_chunk, 0
+    while start < len(pending):
+        chunk_pending = pending[start:start+size]
+        with timed(summary, 'parse', files=len(chunk_pending)) as counts:
+            chunk_progress = None if progress is None else ChunkProgress(progress, start)
+            raw_df = parse_multiple_files([item['path'] for item in chunk_pending], chunk_progress,
+                                          workers=workers, drop_empty=False)
+            counts['rows'] = len(raw_df)
+        checkpoint(progress)
+        filled = raw_df.notna().any()
+        for column in raw_df.columns:
+            raw_columns[column] = raw_columns.get(column, False) or bool(filled[column])
+        path = os.path.join(spool, 'chunk_{:06d}.pkl'.format(len(chunks)))
+        raw_df.to_pickle(path)
+        chunks.append((chunk_pending, path))
+        #Parsed records, the raw and the cleaned frame and the csv text are alive at once,
+        #with the parsing and pandas overhead about six times the raw frame
+        file_bytes = max(file_bytes, raw_df.memory_usage(deep=True).sum()/max(len(chunk_pending), 1))
+        start += len(chunk_pending)
+        size = max(1, int(memory_budget*2**20/(6*file_bytes))) if file_bytes else len(pending)
+        if summary is not None:
+            summary['rows'] += len(raw_df)
+            summary['chunks'] += 1
+        del raw_df
+    return chunks, [column for column, has_value in raw_columns.items() if has_value]
+
+#The invalid raw column and the kept columns of clean_dataframe over all the chunks
+def cleaning_decisions(chunks, raw_columns, summary=None):
+    with timed(summary, 'clean'):
+        invalid = None
+        raw = [column for column in raw_columns if 'raw' in column.lower()]
+        for _, path in chunks:
+            raw_df = pd.read_pickle(path)
+            for column in raw:
+                if column in raw_df and (raw_df[column].values == '--.--').any():
+                    #Only the columns before it can still come first
+                    raw, invalid = raw[:raw.index(column)], column
+                    break
+        columns = [column for column in raw_columns if not dropped_by_name(column)]
+        values, newlines, count = pd.Series(dtype=int), pd.Series(dtype=int), 0
+        for _, path in chunks:
+            raw_df = pd.read_pickle(path)
+            rows = valid_rows(raw_df, invalid)
+            chunk_values, chunk_newlines = column_counts(raw_df, columns, rows)
+            values = values.add(chunk_values, fill_value=0)
+            newlines = newlines.add(chunk_newlines, fill_value=0)
+            count += len(raw_df) if rows is None else int(rows.sum())
+    return invalid, kept_columns(columns, values, newlines, count)
+
+def export_directory(directory, filename, progress=None, workers=None, summary=None):
+    return export_files([os.path.join(directory, file) for file in os.listdir(directory)],
+                        filename, progress, workers, summary)
+
+#Adds files to the dataset filename, returns the new rows (viewer columns only, samples
+#already in the dataset are skipped) and the (sample id, date) keys of the rows they replace
+def append_files(filenames, filename, progress=None, workers=None, summary=None):
+    manifest = load_manifest(filename)
+    pending, clean_df = parse_pending(filenames, manifest, progress, workers, summary)
+    stale = ()
+    with timed(summary, 'write'):
+        if clean_df is not None:
+            output = os.path.abspath(filename)
+            stale = stale_samples(pending).get(output, ())
+            keys = open_keys(filename)
+            keys.drop(stale)
+            rows = len(clean_df)
+            clean_df = new_samples(clean_df, keys)
+            if summary is not None:
+                summary['duplicates'] = rows-len(clean_df)
+            with span('histograms', rows=len(clean_df)):
+                clean_df = store_histograms(clean_df, filename)
+            with span('append', rows=len(clean_df)):
+                append_dataset(clean_df, filename, stale)
+            keys.add(clean_df)
+            keys.save()
+            clean_df = clean_df[viewer_columns(clean_df.columns)]
+            with span('manifest', files=len(pending)):
+                record_files(manifest, pending, clean_df, dict.fromkeys(clean_df.index, output))
+        save_manifest(manifest, filename)
+    return clean_df, stale
@@ -0,0 +1,87 @@
+#Ingest manifest ---> remembers which XML files already went into which csv file, so
+#re-running on the analyser's results directory only parses new or changed files
+import os
+import json
+import hashlib
+import pandas as pd
+
+def manifest_path(output):
+    return os.path.splitext(output)[0]+'_manifest.json'
+
+def load_manifest(output):
+    try:
+        with open(manifest_path(output)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {'files': dict()}
+
+def save_manifest(manifest, output):
+    path = manifest_path(output)
+    temp_path = path+'.'+str(os.getpid())
+    with open(temp_path, 'w') as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(temp_path, path)
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+#Size and mtime are checked first, the content hash is only computed for files that
+#look new or modified. A new path with an already ingested content is recorded without rows.
+def pending_files(filenames, manifest):
+    files = manifest['files']
+    by_hash = {entry['sha1']: entry for entry in files.values()}
+    pending = []
+    for filename in filenames:
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        entry = files.get(path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            continue
+        digest = file_hash(path)
+        if entry is not None and entry['sha1'] == digest:
+            entry['mtime'] = stat.st_mtime
+            continue
+        if entry is None and digest in by_hash:
+            #The copy wrote no rows, editing it later must not replace the original's
+            files[path] = dict(by_hash[digest], size=stat.st_size, mtime=stat.st_mtime, output=None, sample=None)
+            continue
+        pending.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                        'sha1': digest, 'previous': entry})
+    return pending
+
+#Rows written from the previous version of a changed file, per output csv
+def stale_samples(pending):
+    stale = dict()
+    for item in pending:
+        entry = item['previous']
+        if entry is not None and entry.get('output') is not None:
+            stale.setdefault(entry['output'], set()).add(tuple(entry['sample']))
+    return stale
+
+def sample_key(row):
+    return [str(row[column]) if pd.notna(row[column]) else '' for column in ['FIELD_SID_SAMPLE_ID', 'ANALYSIS_DATE']]
+
+#clean_df keeps the row labels of parse_multiple_files, i.e. the position in pending,
+#outputs maps those labels to the csv file the row went into
+def record_files(manifest, pending, clean_df, outputs):
+    for idx, item in enumerate(pending):
+        entry = {'size': item['size'], 'mtime': item['mtime'], 'sha1': item['sha1'],
+                 'output': None, 'sample': None}
+        if idx in outputs:
+            entry['output'] = outputs[idx]
+            entry['sample'] = sample_key(clean_df.loc[idx])
+        manifest['files'][item['path']] = entry
+
+def drop_samples(dataframe, samples):
+    if not samples:
+        return dataframe
+    dates = dataframe['ANALYSIS_DATE']
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        #Typed datasets ---> back to the analyser's format used in the manifest keys
+        dates = dates.dt.strftime('%Y/%m/%d %H:%M:%S')
+    keys = zip(dataframe['FIELD_SID_SAMPLE_ID'].fillna('').astype(str), dates.fillna('').astype(str))
+    return dataframe[[key not in samples for key in keys]]
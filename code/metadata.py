@@ -0,0 +1,68 @@
+#Metadata ---> the imported sheet is kept as its own table indexed by animal_id instead of
+#being merged into the dataset. Rows get their metadata only when they are shown, exported
+#or plotted, through a lookup from the patient id categories to the metadata rows.
+#Parsed sheets are cached (in memory and on disk) until the file changes.
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+cache_dir = os.path.join(os.path.expanduser('~'), '.bas', 'metadata')
+metadata_sheets = dict()
+key_column = 'animal_id'
+
+def cache_path(filename, cache_dir=cache_dir):
+    return os.path.join(cache_dir, hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()+'.pkl')
+
+def parse_metadata(filename):
+    if filename.split('.')[-1] == 'csv':
+        metadata = pd.read_csv(filename)
+    else:
+        metadata = pd.ExcelFile(filename).parse()
+    metadata[key_column] = metadata[key_column].astype(str)
+    #One row per animal, the last one wins like a later correction in the sheet
+    return metadata.drop_duplicates(key_column, keep='last').set_index(key_column)
+
+#cache_dir=None keeps the parsed sheets in memory only
+def read_metadata(filename, cache_dir=cache_dir):
+    stat = os.stat(filename)
+    stamp = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+    if stamp in metadata_sheets:
+        return metadata_sheets[stamp]
+    metadata = None
+    if cache_dir is not None:
+        try:
+            cached_stamp, metadata = pd.read_pickle(cache_path(filename, cache_dir))
+            if tuple(cached_stamp) != stamp:
+                metadata = None
+        except Exception:
+            metadata = None
+    if metadata is None:
+        metadata = parse_metadata(filename)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            pd.to_pickle((stamp, metadata), cache_path(filename, cache_dir))
+    metadata_sheets[stamp] = metadata
+    return metadata
+
+#Another sheet for the same study ---> its animals and columns are added, its values win
+#over the loaded ones; replace drops what was loaded before
+def update_metadata(metadata, new_metadata, replace=False):
+    if metadata is None or replace:
+        return new_metadata
+    return new_metadata.combine_first(metadata)[list(dict.fromkeys(list(metadata.columns)+list(new_metadata.columns)))]
+
+#dataframe with the metadata columns of its patients added (NaN for unknown animals)
+def join_metadata(dataframe, metadata, patient_column='FIELD_SID_PATIENT_ID'):
+    patients = dataframe[patient_column]
+    if isinstance(patients.dtype, pd.CategoricalDtype):
+        #One lookup per patient id instead of one per row
+        positions = metadata.index.get_indexer(patients.cat.categories.astype(str))
+        #Missing patient ids have code -1 ---> the appended -1 (no metadata row)
+        rows = np.append(positions, -1)[patients.cat.codes.to_numpy()]
+    else:
+        rows = metadata.index.get_indexer(patients.astype(str))
+    columns = [column for column in metadata.columns if column not in dataframe.columns]
+    joined = metadata[columns].reset_index(drop=True).reindex(rows)
+    joined.index = dataframe.index
+    return pd.concat([dataframe, joined], axis=1)
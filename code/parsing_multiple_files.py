@@ -1,3 +1,5 @@
+import sys
+import numpy as np
 from utils import *
 
 #1) Parsing the xml file through the ElementTree parse function
@@ -11,7 +13,7 @@ output_name = sys.argv[-1]
 
 filenames = os.listdir(directory)
 
-export_df = pd.DataFrame()
+rows = []
 
 test_files = np.random.randint(0, len(filenames)-1, 10, dtype=int)
 
@@ -73,10 +75,12 @@ for loc, file in enumerate(filenames):
             pass
         if np.in1d(loc, test_files)[0]:
             print(string)
-    export_df = export_df.append(df)
+    rows.append(df)
     
         #n+=1
 
+#DataFrame.append copied the whole frame for every file, the rows are concatenated once instead
+export_df = pd.concat(rows) if rows else pd.DataFrame()
 #export_df.index = index
 export_df.dropna(how='all', axis=1)
 out_file = os.path.join('\\'.join(root_dir.split('\\')[:-1]), 'tests', output_name)
@@ -0,0 +1,109 @@
+#Instrumentation ---> named spans around the pipeline stages and the plots. Each span records
+#its wall and CPU time, the peak RSS of the process when it ended and counts (rows, files...)
+#set by the code it wraps. Spans opened inside another one keep its name as their parent.
+#Off by default: enable() turns it on at runtime, as does BAS_PROFILE=1 in the environment.
+#CPU time is the one of the calling thread, the parsing processes are not included.
+#   with span('parse', files=len(filenames)) as counts:
+#       df = parse_multiple_files(filenames)
+#       counts['rows'] = len(df)
+import os
+import sys
+import csv
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    #Windows ---> psutil, if installed, gives the peak working set
+    resource = None
+
+fields = ['name', 'parent', 'thread', 'start', 'seconds', 'cpu_seconds', 'peak_rss_mb']
+enabled = os.environ.get('BAS_PROFILE', '0') not in ('', '0')
+records = []
+lock = threading.Lock()
+stacks = threading.local()
+epoch = time.perf_counter()
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+def reset():
+    with lock:
+        records.clear()
+
+def snapshot():
+    with lock:
+        return list(records)
+
+#Peak resident memory of the process so far in MB, None when it cannot be read
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #Bytes on macOS, kilobytes elsewhere
+        return peak/2**20 if sys.platform == 'darwin' else peak/2**10
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset/2**20
+    except (ImportError, AttributeError):
+        return None
+
+@contextmanager
+def span(name, **counts):
+    if not enabled:
+        yield counts
+        return
+    stack = stacks.__dict__.setdefault('names', [])
+    parent = stack[-1] if stack else ''
+    stack.append(name)
+    start, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield counts
+    finally:
+        record = {'name': name, 'parent': parent, 'thread': threading.current_thread().name,
+                  'start': start-epoch, 'seconds': time.perf_counter()-start,
+                  'cpu_seconds': time.thread_time()-cpu, 'peak_rss_mb': peak_rss_mb()}
+        record.update(counts)
+        stack.pop()
+        with lock:
+            records.append(record)
+
+#Decorator version of span for whole functions
+def profiled(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+#Totals per span name ---> calls, seconds, cpu_seconds, the highest peak_rss_mb and the
+#sum of every count, in the order their first span ended
+def summary(records=None):
+    totals = dict()
+    for record in snapshot() if records is None else records:
+        total = totals.setdefault(record['name'], {'name': record['name'], 'calls': 0, 'seconds': 0.0,
+                                                   'cpu_seconds': 0.0, 'peak_rss_mb': None})
+        total['calls'] += 1
+        for key, value in record.items():
+            if key in ('seconds', 'cpu_seconds') or (key not in fields and isinstance(value, (int, float))):
+                total[key] = total.get(key, 0)+value
+        if record['peak_rss_mb'] is not None:
+            total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0, record['peak_rss_mb'])
+    return list(totals.values())
+
+#Writes the records (all of them by default) as json or, for any other extension, csv
+def export(filename, records=None):
+    records = snapshot() if records is None else records
+    with open(filename, 'w', newline='') as fh:
+        if filename.lower().endswith('.json'):
+            json.dump(records, fh, indent=1)
+        else:
+            columns = fields + sorted({key for record in records for key in record if key not in fields})
+            writer = csv.DictWriter(fh, columns)
+            writer.writeheader()
+            writer.writerows(records)
@@ -0,0 +1,189 @@
+#Local query service ---> loads a dataset once and answers http/json queries on it, so scripts
+#and dashboards do not each read and parse the csv. Answers are kept in an in-process cache
+#(least recently used, --cache-mb) and the dataset is loaded again when its file changes,
+#e.g. after the watch-folder ingest appended rows. Every request runs in its own thread.
+#   python query_service.py exports/study_GUEZGUEZ.csv --port 8765
+#   GET /samples?patient=1021,1022&sample_type=BLOOD&family=RBC&start=2023-01-01&end=2023-06-30
+#       patient and sample_type (FIELD_SID_ANIMAL_NAME) select the samples, all of them when
+#       left out. family is PLT, RBC or WBC (all three by default), start/end are inclusive
+#       days and limits=1 adds the LowLimit/HighLimit columns.
+#   GET /patients, /sample_types, /families, /status
+import os
+import sys
+import json
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+from dataset import dataset_columns, viewer_columns, load_dataset, sample_index, sample_rows
+from series import family_dict, limit_names, PlotCache
+
+class QueryError(Exception):
+    pass
+
+#Values and limits of the features, floats at the precision they were measured with
+def to_json_floats(values):
+    values = np.asarray(values)
+    return values.astype(str).astype(np.float64) if values.dtype == np.float32 else values
+
+class DatasetQueries:
+    def __init__(self, filename, cache_mb=64):
+        self.filename = os.path.abspath(filename)
+        self.cache = PlotCache(cache_mb*2**20)
+        self.lock = threading.Lock()
+        self.state = None
+        self.current()
+
+    #(stamp, dataframe, sample index) of the dataset file as it is now
+    def current(self):
+        stat = os.stat(self.filename)
+        stamp = (stat.st_size, stat.st_mtime)
+        state = self.state
+        if state is not None and state[0] == stamp:
+            return state
+        with self.lock:
+            if self.state is None or self.state[0] != stamp:
+                dataframe = load_dataset(self.filename, columns=viewer_columns(dataset_columns(self.filename)))
+                self.state = (stamp, dataframe, sample_index(dataframe))
+                self.cache.clear()
+            return self.state
+
+    def cached(self, key, answer):
+        with self.lock:
+            body = self.cache.get(key)
+        if body is None:
+            body = answer()
+            with self.lock:
+                self.cache.put(key, body)
+        return body
+
+    def patients(self):
+        _, dataframe, _ = state = self.current()
+        return self.cached((state[0], 'patients'), lambda: json.dumps(
+            {'patients': sorted(dataframe['FIELD_SID_PATIENT_ID'].dropna().astype(str).unique().tolist())}).encode())
+
+    def sample_types(self):
+        _, dataframe, _ = state = self.current()
+        return self.cached((state[0], 'sample_types'), lambda: json.dumps(
+            {'sample_types': sorted(dataframe['FIELD_SID_ANIMAL_NAME'].dropna().astype(str).unique().tolist())}).encode())
+
+    def status(self):
+        stamp, dataframe, _ = self.current()
+        return json.dumps({'dataset': self.filename, 'rows': len(dataframe), 'columns': dataframe.shape[1],
+                           'cache_entries': len(self.cache.entries), 'cache_bytes': self.cache.nbytes}).encode()
+
+    def samples(self, params):
+        patients = sorted({patient for value in params.get('patient', []) for patient in value.split(',') if patient})
+        sample_type = params.get('sample_type', [None])[-1]
+        family = params.get('family', [None])[-1]
+        if family is not None:
+            family = family.upper()
+            if not family.endswith(' FAMILY'):
+                family += ' FAMILY'
+            if family not in family_dict:
+                raise QueryError('unknown family {}, use one of PLT, RBC, WBC'.format(params['family'][-1]))
+        try:
+            start = pd.Timestamp(params['start'][-1]) if 'start' in params else None
+            end = pd.Timestamp(params['end'][-1])+pd.Timedelta(days=1) if 'end' in params else None
+        except ValueError as error:
+            raise QueryError('bad date: {}'.format(error))
+        limits = params.get('limits', ['0'])[-1] not in ('0', '', 'false')
+        state = self.current()
+        key = (state[0], 'samples', tuple(patients), sample_type, family, start, end, limits)
+        return self.cached(key, lambda: self.select(state, patients, sample_type, family, start, end, limits))
+
+    def select(self, state, patients, sample_type, family, start, end, limits):
+        _, dataframe, index = state
+        if patients and sample_type is not None:
+            rows = sample_rows(index, patients, sample_type)
+        else:
+            keep = np.ones(len(dataframe), dtype=bool)
+            if patients:
+                keep &= dataframe['FIELD_SID_PATIENT_ID'].astype(str).isin(patients).to_numpy()
+            if sample_type is not None:
+                keep &= (dataframe['FIELD_SID_ANIMAL_NAME'] == sample_type).to_numpy()
+            rows = np.flatnonzero(keep)
+        dates = dataframe['ANALYSIS_DATE'].to_numpy()[rows]
+        if start is not None:
+            rows, dates = rows[dates >= start.to_datetime64()], dates[dates >= start.to_datetime64()]
+        if end is not None:
+            rows = rows[dates < end.to_datetime64()]
+
+        features = family_dict[family] if family is not None else [feature for features in family_dict.values() for feature in features]
+        names = ['Value']+(limit_names if limits else [])
+        columns = ['FIELD_SID_PATIENT_ID', 'FIELD_SID_ANIMAL_NAME', 'FIELD_SID_SAMPLE_ID', 'ANALYSIS_DATE']
+        columns = [column for column in columns if column in dataframe]
+        values = [feature+'_'+name for feature in features for name in names if feature+'_'+name in dataframe]
+        selected = dataframe[columns+values].iloc[rows]
+        selected = selected.assign(**{column: to_json_floats(selected[column]) for column in values})
+        return ('{{"count":{},"rows":{}}}'.format(len(selected), selected.to_json(orient='records', date_format='iso', date_unit='s'))).encode()
+
+class QueryHandler(BaseHTTPRequestHandler):
+    queries = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        try:
+            if url.path == '/samples':
+                body = self.queries.samples(params)
+            elif url.path == '/patients':
+                body = self.queries.patients()
+            elif url.path == '/sample_types':
+                body = self.queries.sample_types()
+            elif url.path == '/families':
+                body = json.dumps(family_dict).encode()
+            elif url.path == '/status':
+                body = self.queries.status()
+            else:
+                return self.reply(404, {'error': 'unknown path '+url.path})
+        except QueryError as error:
+            return self.reply(400, {'error': str(error)})
+        except Exception as error:
+            return self.reply(500, {'error': '{}: {}'.format(type(error).__name__, error)})
+        self.reply(200, body)
+
+    def reply(self, code, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def make_server(filename, host='127.0.0.1', port=8765, cache_mb=64, verbose=False):
+    handler = type('DatasetHandler', (QueryHandler,), {'queries': DatasetQueries(filename, cache_mb)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Answer http/json queries on a dataset')
+    parser.add_argument('dataset', help='dataset file (.csv, .parquet or .sqlite)')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (127.0.0.1 for this machine only)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-mb', type=int, default=64, help='memory for cached answers')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.dataset):
+        print('No such dataset:', args.dataset, file=sys.stderr)
+        return 2
+    server = make_server(args.dataset, args.host, args.port, args.cache_mb, args.verbose)
+    print('Serving {} on http://{}:{}/'.format(os.path.abspath(args.dataset), *server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
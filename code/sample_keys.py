@@ -0,0 +1,125 @@
+#Sample identity keys ---> the analyser exports the same sample again in later result folders,
+#under another file name, so the manifest (which knows files) does not see the repetition.
+#Every row of a dataset has a 64-bit hash of its identity (sample id, analysis date, patient id
+#and the analyser's name/version), kept in <dataset>_keys.bin next to it, and ingest skips the
+#rows whose identity is already there. Each pair also holds the hash of the manifest key
+#(sample id, date), so the keys of re-exported files are removed with their rows.
+#The pairs are appended to the file as rows are written, the file is only rewritten when keys
+#are removed. A dataset without the file (written before, or by another tool) gets it built
+#from its identity columns the first time.
+import os
+import numpy as np
+import pandas as pd
+from dataset import date_format, as_text, dataset_columns, load_dataset
+
+identity_columns = ['FIELD_SID_SAMPLE_ID', 'ANALYSIS_DATE', 'FIELD_SID_PATIENT_ID', 'ANALYSER_NAME', 'ANALYSER_VERSION']
+sample_columns = ['FIELD_SID_SAMPLE_ID', 'ANALYSIS_DATE']
+#Keys added since the lookup table was built, merged into it beyond this share of it
+recent_share = 0.25
+
+def keys_path(output):
+    return os.path.splitext(output)[0]+'_keys.bin'
+
+#Identity columns as text, like the manifest keys: typed dates back in the analyser's
+#format, missing values and columns as ''
+def key_text(dataframe, columns):
+    text = dict()
+    for column in columns:
+        values = dataframe[column] if column in dataframe else pd.Series(np.nan, index=dataframe.index)
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime(date_format)
+        text[column] = as_text(values).fillna('')
+    return pd.DataFrame(text, index=dataframe.index)
+
+def hash_rows(text):
+    return pd.util.hash_pandas_object(text, index=False).to_numpy(dtype=np.uint64)
+
+#(identity, manifest key) hash pairs of the rows of dataframe
+def row_keys(dataframe):
+    return np.column_stack([hash_rows(key_text(dataframe, identity_columns)),
+                            hash_rows(key_text(dataframe, sample_columns))]).astype(np.uint64).reshape(-1, 2)
+
+class SampleKeys:
+    def __init__(self, output):
+        self.output = os.path.abspath(output)
+        self.path = keys_path(self.output)
+        self.pending = []       #pairs not in the file yet
+        self.rewrite = False    #keys were removed or rebuilt, the file is written again
+        self.keys = self.load()
+        self.lookup = None      #unique identities, pandas builds its hash table on the first lookup
+        self.recent = set()     #identities added since lookup was built
+
+    def load(self):
+        if not os.path.exists(self.output):
+            #No dataset (anymore) ---> nothing to compare with, an old file is replaced
+            self.rewrite = os.path.exists(self.path)
+            return np.empty((0, 2), dtype=np.uint64)
+        if os.path.exists(self.path):
+            return np.fromfile(self.path, dtype='<u8').astype(np.uint64).reshape(-1, 2)
+        columns = [column for column in dataset_columns(self.output) if column in identity_columns]
+        self.rewrite = True
+        return row_keys(load_dataset(self.output, columns=columns))
+
+    def stamp(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+
+    #Boolean mask of the rows of dataframe whose sample is new, repeated rows of dataframe
+    #keep their first occurrence
+    def new_rows(self, dataframe):
+        keys = row_keys(dataframe)
+        if self.lookup is None:
+            self.lookup = pd.Index(pd.unique(self.keys[:, 0]))
+            self.recent = set()
+        known = self.lookup.get_indexer(keys[:, 0]) >= 0
+        if self.recent:
+            known |= np.fromiter((key in self.recent for key in keys[:, 0].tolist()), dtype=bool, count=len(keys))
+        return ~known & ~pd.Series(keys[:, 0]).duplicated().to_numpy()
+
+    def add(self, dataframe):
+        keys = row_keys(dataframe)
+        if not len(keys):
+            return
+        self.keys = np.concatenate([self.keys, keys])
+        self.pending.append(keys)
+        if self.lookup is not None:
+            self.recent.update(keys[:, 0].tolist())
+            if len(self.recent) > recent_share*max(len(self.lookup), 1024):
+                self.lookup = None
+
+    #Removes the keys of the rows with these (sample id, date) keys of the manifest
+    def drop(self, samples):
+        if not samples or not len(self.keys):
+            return
+        stale = hash_rows(pd.DataFrame(list(samples), columns=sample_columns))
+        keep = ~np.isin(self.keys[:, 1], stale)
+        if not keep.all():
+            self.keys = self.keys[keep]
+            self.pending, self.rewrite, self.lookup = [], True, None
+
+    def save(self):
+        if self.rewrite:
+            temp_path = self.path+'.'+str(os.getpid())
+            self.keys.astype('<u8').tofile(temp_path)
+            os.replace(temp_path, self.path)
+        elif self.pending:
+            with open(self.path, 'ab') as fh:
+                for keys in self.pending:
+                    keys.astype('<u8').tofile(fh)
+        self.pending, self.rewrite = [], False
+        opened[self.output] = (self.stamp(), self)
+
+#The key index of each output is kept for the next ingest of the process (watch folder, viewer
+#imports), until its file is changed by someone else
+opened = dict()
+
+def open_keys(output):
+    output = os.path.abspath(output)
+    stamp, keys = opened.get(output, (None, None))
+    if keys is None or stamp is None or keys.stamp() != stamp or not os.path.exists(output):
+        keys = SampleKeys(output)
+        opened[output] = (keys.stamp(), keys)
+    return keys
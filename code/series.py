@@ -0,0 +1,125 @@
+#Time-series extraction ---> the selected rows are gathered once, the Value/LowLimit/HighLimit
+#columns of a whole feature family are taken out in a single block and split per patient,
+#so plotting only iterates over ready-made arrays
+import sys
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+PLT = ['MPV','PLT']
+RBC = ['HCT', 'HGB', 'MCH', 'MCHC', 'MCV', 'RBC', 'RDW']
+WBC = ['EOS%', 'EOS#', 'GRA%', 'GRA#', 'LYM%', 'LYM#', 'MON%', 'MON#', 'WBC']
+
+family_dict = {'PLT FAMILY': PLT, 'RBC FAMILY': RBC, 'WBC FAMILY': WBC}
+
+families = ['PLT FAMILY', 'RBC FAMILY', 'WBC FAMILY']
+
+limit_names = ['LowLimit', 'HighLimit']
+
+def family_columns(features):
+    return [feature+'_'+name for feature in features for name in ['Value']+limit_names]
+
+#patient_rows maps each patient to its row positions in dataframe, returns
+#   {'patients': [...], 'dates': {patient: days}, 'values': {feature: {patient: values}},
+#    'limits': {feature: {patient: (low, high)}}}
+#with the days as 'YYYY/MM/DD' strings and missing columns as NaN
+def family_series(dataframe, patient_rows, features):
+    patients = list(patient_rows)
+    rows = [np.asarray(patient_rows[patient], dtype=np.intp) for patient in patients]
+    positions = np.concatenate(rows) if rows else np.array([], dtype=np.intp)
+    bounds = np.cumsum([0]+[len(row) for row in rows])
+    columns = family_columns(features)
+    present = [column for column in columns if column in dataframe.columns]
+    block = np.full((len(positions), len(columns)), np.nan, dtype=np.float32)
+    if present:
+        block[:, [columns.index(column) for column in present]] = dataframe[present].iloc[positions].to_numpy(dtype=np.float32)
+    days = dataframe['ANALYSIS_DATE'].iloc[positions].dt.strftime('%Y/%m/%d').to_numpy()
+
+    series = {'patients': patients, 'dates': dict(), 'values': dict(), 'limits': dict()}
+    for idx, patient in enumerate(patients):
+        series['dates'][patient] = days[bounds[idx]:bounds[idx+1]]
+    for idy, feature in enumerate(features):
+        values, limits = dict(), dict()
+        for idx, patient in enumerate(patients):
+            patient_block = block[bounds[idx]:bounds[idx+1], 3*idy:3*idy+3]
+            values[patient] = patient_block[:, 0]
+            limits[patient] = tuple(patient_block[0, 1:]) if len(patient_block) else None
+        series['values'][feature] = values
+        series['limits'][feature] = limits
+    return series
+
+#Metadata groups of the boxplot view ---> points, means and standard deviations of every
+#(analysis day, group) cell for all the features at once. Groups are the positions in
+#uniques, blank values being no group. by_date spreads the groups of each day around its
+#tick (width apart), otherwise the x position is the group itself. Returns arrays the
+#plotting code uses directly.
+def group_statistics(dataframe, column, uniques, features, by_date=False, width=0.5):
+    uniques = [unique for unique in uniques if pd.notna(unique)]
+    count = len(uniques)
+    groups = pd.Categorical(dataframe[column], categories=uniques).codes
+    keep = groups >= 0
+    groups = groups[keep].astype(np.intp)
+    values = dataframe[features].to_numpy(dtype=np.float64)[keep]
+    if by_date:
+        days = dataframe['ANALYSIS_DATE'].dt.strftime('%Y/%m/%d').to_numpy()[keep]
+        labels, day_codes = np.unique(days.astype(str), return_inverse=True)
+        step = width*(count+1)
+        position = lambda day, group: step*day + width*(1+group)
+        ticks = step*np.arange(len(labels)) + step/2
+        xlim = (-0.5, (ticks[-1] if len(ticks) else 0)+1.5)
+    else:
+        labels, day_codes = np.asarray(uniques), np.zeros(len(groups), dtype=np.intp)
+        position = lambda day, group: group.astype(np.float64)
+        ticks = np.arange(count)
+        xlim = (-0.5, count-0.5)
+
+    cells = day_codes*count + groups
+    grouped = pd.DataFrame(values).groupby(cells)
+    means = grouped.mean()
+    cell_ids = means.index.to_numpy()
+    return {'labels': labels, 'ticks': ticks, 'xlim': xlim,
+            'point_x': position(day_codes, groups), 'point_group': groups, 'values': values,
+            'cell_x': position(cell_ids//count, cell_ids % count), 'cell_group': cell_ids % count,
+            'means': means.to_numpy(), 'stds': grouped.std(ddof=0).to_numpy()}
+
+#Approximate memory held by prepared plot data (arrays, dataframes and containers of them)
+def data_nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True)))
+    if isinstance(value, dict):
+        return sum(data_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(data_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+#Least recently used cache of prepared plot data, the oldest entries are dropped once the
+#entries hold more than max_bytes
+class PlotCache:
+    def __init__(self, max_bytes=64*2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        size = data_nbytes(value)
+        if size > self.max_bytes:
+            return value
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            self.nbytes -= self.entries.popitem(last=False)[1][1]
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
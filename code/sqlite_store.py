@@ -0,0 +1,236 @@
+#SQLite datasets (.sqlite/.db) ---> one file, no server, standard library only. The samples
+#table holds one row per sample (ids, owner, sample type, date, ...), the measurements are in
+#results, one row per (sample, parameter) with the value and the reference limits, which are
+#stored once per distinct (parameter, low, high) in limits. Indexes on patient id, date, sample
+#type and owner let a selection read only its own samples, e.g. the viewer's plots:
+#   load_sqlite('study_GUEZGUEZ.sqlite', patient_ids=['1021'], sample_type='BLOOD')
+#load_dataset/append_dataset in dataset.py pick this module by the file extension (is_sqlite).
+import os
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from dataset import numeric_suffixes, parse_dates, as_text, apply_schema
+
+#ANALYSIS_DATE is stored as text that sorts like the dates
+sql_date_format = '%Y-%m-%d %H:%M:%S'
+#Parameters per statement in IN (...) lists, below the 999 of old SQLite versions
+batch_size = 500
+
+schema = '''
+CREATE TABLE IF NOT EXISTS columns (position INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS samples (sample INTEGER PRIMARY KEY, "FIELD_SID_PATIENT_ID", "FIELD_SID_ANIMAL_NAME",
+                                    "FIELD_SID_OWNER_LASTNAME", "FIELD_SID_SAMPLE_ID", "ANALYSIS_DATE");
+CREATE TABLE IF NOT EXISTS parameters (parameter INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS limits (limits INTEGER PRIMARY KEY, parameter INTEGER NOT NULL, low REAL, high REAL);
+CREATE TABLE IF NOT EXISTS results (sample INTEGER NOT NULL, parameter INTEGER NOT NULL, value REAL, limits INTEGER,
+                                    PRIMARY KEY (sample, parameter)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_patient ON samples ("FIELD_SID_PATIENT_ID", "FIELD_SID_ANIMAL_NAME");
+CREATE INDEX IF NOT EXISTS samples_sample_type ON samples ("FIELD_SID_ANIMAL_NAME");
+CREATE INDEX IF NOT EXISTS samples_date ON samples ("ANALYSIS_DATE");
+CREATE INDEX IF NOT EXISTS samples_owner ON samples ("FIELD_SID_OWNER_LASTNAME");
+CREATE INDEX IF NOT EXISTS samples_key ON samples ("FIELD_SID_SAMPLE_ID", "ANALYSIS_DATE");
+'''
+
+#Column of results or limits that holds each suffix of a parameter column
+parameter_fields = {'_Value': 'value', '_LowLimit': 'low', '_HighLimit': 'high'}
+
+def quote(name):
+    return '"'+name.replace('"', '""')+'"'
+
+#HCT_LowLimit ---> ('HCT', '_LowLimit'), None for the columns of the samples table
+def split_parameter(column):
+    for suffix in numeric_suffixes:
+        if column.endswith(suffix) and len(column) > len(suffix):
+            return column[:-len(suffix)], suffix
+    return None
+
+def connect(filename, create=False):
+    if not create and not os.path.exists(filename):
+        raise FileNotFoundError('No such dataset: '+filename)
+    connection = sqlite3.connect(filename)
+    connection.executescript(schema)
+    return connection
+
+#Dataset columns in the order they were first written
+def stored_columns(connection):
+    return [name for name, in connection.execute('SELECT name FROM columns ORDER BY position')]
+
+def sqlite_columns(filename):
+    with closing(connect(filename)) as connection:
+        return stored_columns(connection)
+
+#Sorted distinct values of one column of the samples table (e.g. the patient ids)
+def sqlite_values(filename, column):
+    with closing(connect(filename)) as connection:
+        query = 'SELECT DISTINCT {0} FROM samples WHERE {0} IS NOT NULL ORDER BY {0}'.format(quote(column))
+        return [value for value, in connection.execute(query)]
+
+def sql_values(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        text = values.dt.strftime(sql_date_format)
+    else:
+        values = values.astype(object)
+        text = values
+        if values.name == 'ANALYSIS_DATE':
+            #Dates that cannot be parsed are kept as they are, they load as NaT like in a csv
+            dates = parse_dates(as_text(values))
+            text = dates.dt.strftime(sql_date_format).where(dates.notna(), values)
+    #Empty strings are NULL, as they are once read back from a csv dataset
+    text = text.astype(object)
+    return text.where(text.notna() & (text != ''), None).tolist()
+
+#Ids of the parameters, new names are added
+def parameter_ids(connection, names):
+    connection.executemany('INSERT OR IGNORE INTO parameters (name) VALUES (?)', [(name,) for name in names])
+    return dict(connection.execute('SELECT name, parameter FROM parameters'))
+
+#Id of the limits of every row (NaN without limits), new (low, high) pairs are added
+def limit_ids(connection, parameter, low, high):
+    pairs = pd.DataFrame({'low': low, 'high': high})
+    groups = pairs.groupby(['low', 'high'], dropna=False, sort=False).ngroup().to_numpy()
+    known = {(low, high): limits for limits, low, high in
+             connection.execute('SELECT limits, low, high FROM limits WHERE parameter = ?', (parameter,))}
+    ids = []
+    for pair in pairs.drop_duplicates().itertuples(index=False, name=None):
+        pair = tuple(None if np.isnan(limit) else limit for limit in pair)
+        if pair == (None, None):
+            ids.append(np.nan)
+            continue
+        if pair not in known:
+            known[pair] = connection.execute('INSERT INTO limits (parameter, low, high) VALUES (?, ?, ?)',
+                                             (parameter,)+pair).lastrowid
+        ids.append(known[pair])
+    return np.array(ids, dtype=float)[groups]
+
+def parameter_values(dataframe, column):
+    if column not in dataframe:
+        return np.full(len(dataframe), np.nan)
+    return pd.to_numeric(dataframe[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+#Bulk insert of the rows of dataframe, the columns it adds are appended to the dataset's
+def insert_rows(connection, dataframe):
+    header = stored_columns(connection)
+    connection.executemany('INSERT INTO columns (name) VALUES (?)',
+                           [(column,) for column in dataframe.columns if column not in header])
+    sample_columns = [column for column in dataframe.columns if split_parameter(column) is None]
+    existing = {row[1] for row in connection.execute('PRAGMA table_info(samples)')}
+    for column in sample_columns:
+        if column not in existing:
+            connection.execute('ALTER TABLE samples ADD COLUMN '+quote(column))
+    names = list(dict.fromkeys(split_parameter(column)[0] for column in dataframe.columns if split_parameter(column) is not None))
+    parameters = parameter_ids(connection, names)
+    if dataframe.empty:
+        return
+
+    first = connection.execute('SELECT COALESCE(MAX(sample), 0)+1 FROM samples').fetchone()[0]
+    samples = np.arange(first, first+len(dataframe))
+    connection.executemany('INSERT INTO samples (sample{}) VALUES (?{})'.format(
+                               ''.join(', '+quote(column) for column in sample_columns), ', ?'*len(sample_columns)),
+                           zip(samples.tolist(), *[sql_values(dataframe[column]) for column in sample_columns]))
+
+    results = []
+    for name in names:
+        values, low, high = [parameter_values(dataframe, name+suffix) for suffix in numeric_suffixes]
+        limits = limit_ids(connection, parameters[name], low, high)
+        keep = ~(np.isnan(values) & np.isnan(limits))
+        results.append(pd.DataFrame({'sample': samples[keep], 'parameter': parameters[name],
+                                     'value': values[keep], 'limits': limits[keep]}))
+    if results:
+        results = pd.concat(results, ignore_index=True).astype(object)
+        results = results.where(results.notna(), None)
+        results['limits'] = [None if limits is None else int(limits) for limits in results['limits']]
+        connection.executemany('INSERT INTO results (sample, parameter, value, limits) VALUES (?, ?, ?, ?)',
+                               results.itertuples(index=False, name=None))
+
+#Removes the samples with these (sample id, date) keys of the manifest
+def delete_samples(connection, samples):
+    keys = pd.DataFrame(list(samples), columns=['FIELD_SID_SAMPLE_ID', 'ANALYSIS_DATE']).replace('', None)
+    keys = list(zip(keys['FIELD_SID_SAMPLE_ID'].astype(object).where(keys['FIELD_SID_SAMPLE_ID'].notna(), None),
+                    sql_values(keys['ANALYSIS_DATE'])))
+    rows = [row for key in keys for row, in connection.execute(
+        'SELECT sample FROM samples WHERE "FIELD_SID_SAMPLE_ID" IS ? AND "ANALYSIS_DATE" IS ?', key)]
+    connection.executemany('DELETE FROM results WHERE sample = ?', [(row,) for row in rows])
+    connection.executemany('DELETE FROM samples WHERE sample = ?', [(row,) for row in rows])
+
+#Adds new rows, removing the rows of re-exported files first, in one transaction
+def append_sqlite(new_df, filename, stale=()):
+    with closing(connect(filename, create=True)) as connection, connection:
+        if stale:
+            delete_samples(connection, stale)
+        insert_rows(connection, new_df)
+
+def drop_sqlite_samples(filename, samples):
+    with closing(connect(filename)) as connection, connection:
+        delete_samples(connection, samples)
+
+#Replaces the rows of the dataset with the ones of dataframe
+def save_sqlite(dataframe, filename):
+    with closing(connect(filename, create=True)) as connection, connection:
+        for table in ['results', 'samples', 'columns']:
+            connection.execute('DELETE FROM '+table)
+        insert_rows(connection, dataframe)
+
+#Conditions on the samples table, None/empty for no condition on that column
+def sample_filters(patient_ids=None, sample_type=None):
+    clauses, params = [], []
+    if patient_ids:
+        patient_ids = [str(patient) for patient in patient_ids]
+        clauses.append('"FIELD_SID_PATIENT_ID" IN ({})'.format(', '.join('?'*len(patient_ids))))
+        params += patient_ids
+    if sample_type is not None:
+        clauses.append('"FIELD_SID_ANIMAL_NAME" = ?')
+        params.append(sample_type)
+    return ' AND '.join(clauses) or '1', params
+
+#Samples of the selection with only the requested columns, measurements back in the wide
+#<parameter>_Value/_LowLimit/_HighLimit layout of the csv datasets
+def select_rows(connection, columns, patient_ids=None, sample_type=None):
+    where, params = sample_filters(patient_ids, sample_type)
+    sample_columns = [column for column in columns if split_parameter(column) is None]
+    samples = pd.read_sql_query('SELECT sample{} FROM samples WHERE {} ORDER BY sample'.format(
+        ''.join(', '+quote(column) for column in sample_columns), where), connection, params=params)
+    #NULL ---> NaN, like the empty values of a csv
+    wide = {column: samples[column].where(samples[column].notna(), np.nan) for column in sample_columns}
+
+    names = list(dict.fromkeys(split_parameter(column)[0] for column in columns if split_parameter(column) is not None))
+    if names:
+        parameters = {name: parameter for name, parameter in connection.execute('SELECT name, parameter FROM parameters')
+                      if name in names}
+        #Whole dataset ---> results is read in its own order, without the join
+        source = 'results r' if not params else 'samples s JOIN results r ON r.sample = s.sample'
+        results = connection.execute('SELECT r.sample, r.parameter, r.value, r.limits FROM {} WHERE {} AND r.parameter IN ({})'.format(
+            source, where, ', '.join(map(str, parameters.values()))), params).fetchall()
+        sample, parameter, value, limits = np.array(results, dtype=float).reshape(-1, 4).T
+        #(low, high) per limits id, the row 0 (no limits) stays NaN
+        limit_table = np.full((connection.execute('SELECT COALESCE(MAX(limits), 0)+1 FROM limits').fetchone()[0], 2), np.nan)
+        for row, low, high in connection.execute('SELECT limits, low, high FROM limits'):
+            limit_table[row] = (np.nan if low is None else low, np.nan if high is None else high)
+        low, high = limit_table[np.nan_to_num(limits).astype(np.intp)].T
+        rows = np.searchsorted(samples['sample'].to_numpy(), sample.astype(np.int64))
+        fields = {'value': value, 'low': low, 'high': high}
+        for name, parameter_id in parameters.items():
+            mine = parameter == parameter_id
+            for suffix, field in parameter_fields.items():
+                if name+suffix in columns:
+                    values = np.full(len(samples), np.nan)
+                    values[rows[mine]] = fields[field][mine]
+                    wide[name+suffix] = values
+    dataframe = pd.DataFrame(wide, columns=columns).set_axis(samples['sample'].to_numpy())
+    if 'ANALYSIS_DATE' in dataframe:
+        dataframe['ANALYSIS_DATE'] = pd.to_datetime(dataframe['ANALYSIS_DATE'], format=sql_date_format, errors='coerce')
+    return apply_schema(dataframe)
+
+#Typed dataframe like load_dataset, optionally only the samples of some patients (in batches,
+#each read through the patient index) and/or of one sample type
+def load_sqlite(filename, columns=None, patient_ids=None, sample_type=None):
+    with closing(connect(filename)) as connection:
+        header = stored_columns(connection)
+        columns = header if columns is None else [column for column in columns if column in header]
+        if not patient_ids or len(patient_ids) <= batch_size:
+            return select_rows(connection, columns, patient_ids, sample_type).reset_index(drop=True)
+        patient_ids = sorted({str(patient) for patient in patient_ids})
+        batches = [select_rows(connection, columns, patient_ids[start:start+batch_size], sample_type)
+                   for start in range(0, len(patient_ids), batch_size)]
+    #Back in the order the samples were written, like the other formats
+    return apply_schema(pd.concat(batches).sort_index().reset_index(drop=True))
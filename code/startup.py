@@ -0,0 +1,25 @@
+#Startup report ---> seconds since the GUI process started importing at every milestone
+#(welcome window shown, viewer modules imported, dataset loaded, ...). The milestones are
+#always recorded, python GUI.py --startup-report also prints them as they happen.
+import sys
+import time
+
+started = time.perf_counter()
+marks = []
+enabled = False
+
+def mark(name):
+    seconds = time.perf_counter()-started
+    marks.append((name, seconds))
+    if enabled:
+        print_mark(name, seconds)
+
+def print_mark(name, seconds):
+    print('startup {:8.3f} s  {}'.format(seconds, name), file=sys.stderr)
+
+#Prints the milestones recorded so far and every later one
+def enable():
+    global enabled
+    enabled = True
+    for name, seconds in marks:
+        print_mark(name, seconds)
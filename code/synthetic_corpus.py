@@ -0,0 +1,105 @@
+#Synthetic MICROS60 corpus ---> writes SampleResult xml files built from the exported
+#files in data/, with varying patients, owners/sample types, dates, values and histograms,
+#so the pipeline can be measured at the scale of a full year of analyses
+import os
+import glob
+import copy
+import argparse
+import xml.etree.ElementTree as et
+from datetime import datetime, timedelta
+import numpy as np
+
+root_dir = os.path.dirname(os.path.realpath(__file__))
+template_dir = os.path.join(os.path.dirname(root_dir), 'data')
+date_format = '%Y/%m/%d %H:%M:%S'
+
+def load_templates(directory=template_dir):
+    return [et.parse(filename) for filename in sorted(glob.glob(os.path.join(directory, '*.xml')))]
+
+def field(root, name):
+    return root.find("*[@n='{}']".format(name))
+
+def decimals(text):
+    return len(text.split('.')[1]) if '.' in text else 0
+
+#Patients keep the same owner for the whole corpus, a few are spleen samples (SP ids)
+def make_patients(count, rng):
+    ids = [('SP{}' if rng.random() < 0.1 else '{}').format(1000+idx) for idx in range(count)]
+    owners = rng.choice(['SCHUPPAN', 'GUEZGUEZ'], size=count)
+    return list(zip(ids, owners))
+
+#The analyser stores GUEZGUEZ samples with the patient id or the sample type as owner
+def sample_owner(patient_id, owner, rng):
+    kind = rng.random()
+    if kind < 0.1:
+        return 'BM'
+    if kind < 0.15:
+        return 'SPL'
+    return patient_id if owner == 'GUEZGUEZ' and kind < 0.6 else owner
+
+def vary_results(root, rng, invalid):
+    for result in root.iter('o'):
+        if result.get('t') != 'SampleParameterResult':
+            continue
+        factor = rng.lognormal(0, 0.15)
+        for name in ['Raw', 'Value']:
+            node = field(result, name)
+            if node is None or node.text is None:
+                continue
+            if invalid:
+                node.text = '--.--'
+            else:
+                places = decimals(node.text)
+                value = round(float(node.text)*factor, places)
+                node.text = str(value) if places else str(int(value))
+
+def vary_histograms(root, rng):
+    for histogram in root.iter('o'):
+        node = histogram.find('st')
+        if histogram.get('n') != 'HISTOGRAM' or node is None or not node.text:
+            continue
+        counts = np.array(node.text.rstrip(';').split(';'), dtype=float)
+        shift = rng.integers(-4, 5)
+        counts = np.roll(counts, shift)
+        if shift > 0:
+            counts[:shift] = 0
+        elif shift < 0:
+            counts[shift:] = 0
+        counts = np.clip(np.rint(counts*rng.lognormal(0, 0.1, size=len(counts))), 0, 223).astype(int)
+        node.text = ';'.join(map(str, counts))+';'
+
+#Writes count files into directory (named after their analysis date, like the analyser does)
+#and returns their paths in analysis order
+def generate_corpus(directory, count, templates=None, patients=200, invalid_rate=0.005, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    templates = templates if templates is not None else load_templates()
+    rng = np.random.default_rng(seed)
+    pool = make_patients(patients, rng)
+    date = datetime(2021, 1, 1)
+    filenames = []
+    for idx in range(count):
+        root = copy.deepcopy(templates[idx % len(templates)].getroot())
+        patient_id, owner = pool[rng.integers(len(pool))]
+        date += timedelta(minutes=int(rng.integers(1, 60)))
+        field(root, 'ANALYSIS_DATE').text = date.strftime(date_format)
+        field(root, 'FIELD_SID_PATIENT_ID').text = patient_id
+        field(root, 'FIELD_SID_OWNER_LASTNAME').text = sample_owner(patient_id, owner, rng)
+        field(root, 'FIELD_SID_SAMPLE_ID').text = 'AUTOSID{:03d}'.format(idx % 1000)
+        vary_results(root, rng, rng.random() < invalid_rate)
+        vary_histograms(root, rng)
+        filename = os.path.join(directory, date.strftime('%Y%m%d%H%M%S')+'.xml')
+        et.ElementTree(root).write(filename, encoding='UTF-8', xml_declaration=True)
+        filenames.append(filename)
+    return filenames
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic MICROS60 xml corpus')
+    parser.add_argument('directory')
+    parser.add_argument('count', type=int)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--invalid-rate', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    filenames = generate_corpus(args.directory, args.count, patients=args.patients,
+                                invalid_rate=args.invalid_rate, seed=args.seed)
+    print('{} files written to {}'.format(len(filenames), args.directory))
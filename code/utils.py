@@ -1,11 +1,10 @@
 import xml.etree.ElementTree as et
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
-import sys
-import numpy as np
-from datetime import datetime
-import time
+import re
+import json
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 root_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -32,95 +31,302 @@ def recursive_parsing(node, identifier='o', attrib_list=[], val_list=[], idef=''
 
     return attrib_list, val_list
 
-def parse_multiple_files(filenames, progress_bar=None):
-    dict_list = []
-    for idx, file in enumerate(filenames):
-        if progress_bar is not None:
-            progress_bar.setValue(idx+1)
-        tree = et.parse(file)
-        root = tree.getroot()
-        attrib_list = []
-        val_list = []
-        attrib_list, val_list = recursive_parsing(root, 'o', attrib_list, val_list)
-        previous_string = ''
-        unit = dict()
-
-        for idy, val in enumerate(attrib_list):
-            string=''
-            try:
-                hist=False
-                thresh=False
-                for idz,key in enumerate(val.keys()):
-                    if idz>=1:
-                        string+='_'+val[key]
+#Streaming solution ---> single pass over the pull-parser events, emitting the same
+#column names as recursive_parsing + the attribute loop (e.g. MPV_HighLimit,
+#PLT_THRESHOLDS_SampleThresholds, FLAGS_HISTOGRAM_SampleHistogram)
+#When a plan dict is given, the naming decision taken for every node is stored in it
+#(see flatten_with_plan)
+def parse_xml_record(file, identifier='o', chunk_size=65536, plan=None):
+    record = dict()
+    #Per open o node: the prefix handed to its children
+    prefixes = []
+    #Leaf node currently open, anything nested inside it is ignored like in recursive_parsing
+    leaf = None
+    #Last parsed column, its family prefix names the next HISTOGRAM/THRESHOLDS
+    previous = ''
+    #Column names of the open HISTOGRAM/THRESHOLDS nodes, fixed when the node starts
+    payloads = []
+    parser = et.XMLPullParser(events=('start', 'end'))
+    with open(file, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    if leaf is not None:
+                        continue
+                    if not prefixes:
+                        root = elem
+                        prefixes.append('')
+                    elif elem.tag != identifier:
+                        leaf = elem
                     else:
-                        string+=val[key]
-                    if val[key] == 'HISTOGRAM':
-                        hist=True
-                    if val[key] == 'THRESHOLDS':
-                        thresh=True
-                if hist and 'Flags':
-                    string = previous_string.split('_')[0]+'_'+string
-                    unit[string] = val_list[idy+1]
-                elif thresh:
-                    string = previous_string.split('_')[0]+'_'+string
-                    out = []
-                    n=1
-                    while True:
-                        if not attrib_list[idy+n]:
-                            out.append(val_list[idy+n])
+                        #Nested nodes keep their own name, only the leaves get the parent prefix
+                        attrib = elem.attrib
+                        name = attrib.get('n', '')
+                        key = (prefixes[-1], elem.tag, attrib.get('n'))
+                        prefixes.append(name)
+                        values = attrib.values()
+                        string = '_'.join(values)
+                        if 'HISTOGRAM' in values or 'THRESHOLDS' in values:
+                            family = previous.split('_', 1)[0]
+                            payloads.append(family+'_'+string)
+                            if plan is not None:
+                                kind = 'first' if 'HISTOGRAM' in values else 'join'
+                                plan[key] = (None, True, kind)
+                                plan[key+(family,)] = (family+'_'+string, True, kind)
                         else:
-                            break
-                        n+=1
-                    unit[string] = (';').join(out)
-                elif 'Flags' in string and attrib_list[idy]['n'].lower()!='flags':
-                    pass
+                            previous = string
+                            keep = 'Flags' not in string or name.lower() == 'flags'
+                            if keep:
+                                record[string] = None
+                            if plan is not None:
+                                plan[key] = (string, keep, 'o')
+                    continue
+
+                if leaf is None:
+                    prefixes.pop()
+                    if not prefixes:
+                        continue
+                    values = elem.attrib.values()
+                    if 'HISTOGRAM' in values:
+                        record[payloads.pop()] = elem[0].text if len(elem) else None
+                    elif 'THRESHOLDS' in values:
+                        string = payloads.pop()
+                        out = [child.text for child in elem if not child.attrib]
+                        if None not in out:
+                            record[string] = ';'.join(out)
+                    else:
+                        string = '_'.join(values)
+                        if string in record:
+                            record[string] = elem.text
+                    if len(prefixes) == 1:
+                        root.clear()
+                    continue
+                if elem is not leaf:
+                    continue
+
+                leaf = None
+                attrib = elem.attrib
+                text = elem.text
+                prefix = prefixes[-1]
+                if not attrib:
+                    #Unnamed payload nodes (<st> inside HISTOGRAM/THRESHOLDS) are consumed by their parent
+                    if text is not None:
+                        previous = ': '+text
+                    if plan is not None:
+                        plan[(prefix, elem.tag, None)] = (None, False, 'payload')
+                    continue
+                name = attrib.get('n')
+                key = (prefix, elem.tag, name)
+                if len(attrib) == 1 and name is not None:
+                    string = prefix+'_'+name if prefix else name
                 else:
-                    unit[string] = val_list[idy]
-                    string+=': '+val_list[idy]
-                previous_string = string
-            except:
-                pass
-        dict_list.append(unit)
+                    if name is not None and prefix:
+                        name = prefix+'_'+name
+                    string = '_'.join(name if attr == 'n' else value for attr, value in attrib.items())
+                keep = 'Flags' not in string or (name or '').lower() == 'flags'
+                if keep:
+                    record[string] = text
+                if not keep or text is not None:
+                    previous = string
+                if plan is not None:
+                    plan[key] = (string, keep, 'leaf')
+    parser.close()
+    return record
+
+#Compiled flattening plans ---> one per ANALYSER_NAME/ANALYSER_VERSION, mapping
+#(parent name, tag, name) of every node to (column, kept?, kind). HISTOGRAM/THRESHOLDS
+#nodes get a second entry keyed with the family prefix they take from the previous column.
+plans_dir = os.path.join(os.path.expanduser('~'), '.bas', 'plans')
+flattening_plans = dict()
+
+def analyser_of(root):
+    name = version = ''
+    for child in root:
+        if child.get('n') == 'ANALYSER_NAME':
+            name = (child.text or '').strip()
+        elif child.get('n') == 'ANALYSER_VERSION':
+            version = (child.text or '').strip()
+        if name and version:
+            break
+    return name, version
+
+def plan_path(name, version, plan_dir=plans_dir):
+    return os.path.join(plan_dir, re.sub(r'[^\w.-]+', '_', name+'_'+version)+'.json')
+
+def load_plan(name, version, plan_dir=plans_dir):
+    if (plan_dir, name, version) not in flattening_plans:
+        plan = dict()
+        if plan_dir is not None:
+            try:
+                with open(plan_path(name, version, plan_dir)) as fh:
+                    plan = {tuple(key): tuple(entry) for key, entry in json.load(fh)}
+            except (OSError, ValueError):
+                plan = dict()
+        flattening_plans[(plan_dir, name, version)] = plan
+    return flattening_plans[(plan_dir, name, version)]
+
+def save_plan(plan, name, version, plan_dir=plans_dir):
+    os.makedirs(plan_dir, exist_ok=True)
+    path = plan_path(name, version, plan_dir)
+    #Written aside and swapped in, parallel workers may save the same plan at once
+    temp_path = path+'.'+str(os.getpid())
+    with open(temp_path, 'w') as fh:
+        json.dump([[list(key), list(entry)] for key, entry in plan.items()], fh)
+    os.replace(temp_path, path)
+
+#Fast path: walks the parsed tree and only looks the columns up, raises KeyError on
+#a node the plan has never seen
+def flatten_with_plan(node, parent, plan, record, previous=''):
+    for child in node:
+        name = child.get('n')
+        key = (parent, child.tag, name)
+        column, keep, kind = plan[key]
+        if kind == 'leaf':
+            text = child.text
+            if keep:
+                record[column] = text
+            if not keep or text is not None:
+                previous = column
+        elif kind == 'o':
+            if keep:
+                record[column] = child.text
+            previous = flatten_with_plan(child, name or '', plan, record, column)
+        elif kind == 'payload':
+            if child.text is not None:
+                previous = ': '+child.text
+        else:
+            column = plan[key+(previous.split('_', 1)[0],)][0]
+            texts = [grandchild.text for grandchild in child if not grandchild.attrib]
+            if kind == 'first':
+                record[column] = child[0].text if len(child) else None
+            elif None not in texts:
+                record[column] = ';'.join(texts)
+            for text in texts:
+                if text is not None:
+                    previous = ': '+text
+    return previous
+
+def parse_xml_file(file, plan_dir=plans_dir):
+    root = et.parse(file).getroot()
+    name, version = analyser_of(root)
+    plan = load_plan(name, version, plan_dir)
+    record = dict()
+    try:
+        flatten_with_plan(root, '', plan, record)
+    except KeyError:
+        #Unknown node for this analyser version ---> full discovery, which also extends the plan
+        size = len(plan)
+        record = parse_xml_record(file, plan=plan)
+        if plan_dir is not None and len(plan) > size:
+            save_plan(plan, name, version, plan_dir)
+    return record
+
+def report_progress(records, progress_bar=None):
+    dict_list = []
+    for idx, record in enumerate(records):
+        if progress_bar is not None:
+            progress_bar.setValue(idx+1)
+        dict_list.append(record)
+    return dict_list
+
+#workers > 1 parses the files in a process pool (workers=None uses every core),
+#records come back in input order and chunk_size files are sent to a worker at once
+#plan_dir=None keeps the flattening plans in memory only, drop_empty=False keeps the columns
+#without any value (chunked exports need every column in the order it first appeared)
+def parse_multiple_files(filenames, progress_bar=None, workers=1, chunk_size=16, plan_dir=plans_dir, drop_empty=True):
+    filenames = list(filenames)
+    parse = partial(parse_xml_file, plan_dir=plan_dir)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(filenames) > chunk_size:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            records = executor.map(parse, filenames, chunksize=chunk_size)
+            dict_list = report_progress(records, progress_bar)
+        finally:
+            #The progress bar may raise to stop the parsing, the queued chunks are dropped then
+            executor.shutdown(cancel_futures=True)
+    else:
+        dict_list = report_progress(map(parse, filenames), progress_bar)
     out_df = pd.DataFrame.from_records(dict_list)
-    out_df = out_df.dropna(how='all', axis=1)
+    if drop_empty:
+        out_df = out_df.dropna(how='all', axis=1)
     return out_df
 
+def owner_filename(filename, owner):
+    base, extension = os.path.splitext(filename)
+    return base+'_'+owner+(extension or '.csv')
+
+undesired_columns = ['InvalidAlarmStartup', 'InvalidQC', 'ExpiredReagent', 'OPERATOR', 'PACKET_TYPE', 'QCFailed', 'SAMPLING_MODE', 'Archived', 'EOS#_EOS', 'ANALYSIS_TYPE', 'ANALYZER_NO', 'FIELD_SID_PATIENT_SEX', 'FIELD_SID_SAMPLE_TYPE', 'FIELD_SID_SESSIONID', 'VET_VERSION', 'XBDrift']
+#Owner and sample type are rewritten by the fixups below, so they are never empty afterwards
+fixed_columns = ['FIELD_SID_OWNER_LASTNAME', 'FIELD_SID_ANIMAL_NAME']
+
+def dropped_by_name(column):
+    return (('flag' in column.lower() and 'histogram' not in column.lower()) or '_Id' in column
+            or 'Valid' in column or 'Raw' in column or 'Unit' in column or column in undesired_columns)
+
+#First raw column containing '--.--', its '--.--' rows are failed measurements
+def invalid_column(dataframe):
+    for column in dataframe.columns:
+        if 'raw' in column.lower() and (dataframe[column].values == '--.--').any():
+            return column
+    return None
+
+#Keep-mask of the rows (None keeps all of them) for a given invalid column
+def valid_rows(dataframe, column):
+    if column is None or column not in dataframe:
+        return None
+    return dataframe[column].values != '--.--'
+
+def invalid_rows(dataframe):
+    rows = valid_rows(dataframe, invalid_column(dataframe))
+    return None if rows is None else ~rows
+
+#Number of non-null values and of '\n' values of the columns in the kept rows. A column is
+#empty if it has no value or only '\n' values.
+def column_counts(dataframe, columns, rows=None):
+    frame = dataframe[[column for column in columns if column in dataframe]]
+    if rows is not None:
+        frame = frame[rows]
+    return frame.notna().sum(), frame.eq('\n').sum()
+
+def kept_columns(columns, values, newlines, count):
+    return [column for column in columns if (values.get(column, 0) and newlines.get(column, 0) < count)
+            or column in fixed_columns]
+
+#Samples without owner or with a numeric one belong to GUEZGUEZ, any other owner name is
+#actually the sample type (BM, SPLEEN, ...) of a GUEZGUEZ sample
+def fix_owners(dataframe):
+    owner = dataframe['FIELD_SID_OWNER_LASTNAME']
+    owner = owner.mask(owner.isna() | owner.astype(str).str.isnumeric(), 'GUEZGUEZ')
+    other = ~owner.isin(['SCHUPPAN', 'GUEZGUEZ'])
+    animal = dataframe.get('FIELD_SID_ANIMAL_NAME', pd.Series(None, index=dataframe.index, dtype=object))
+    animal = animal.mask(other, owner).fillna('BLOOD')
+    spleen = animal.isin(['SPL', 'SP']) | dataframe['FIELD_SID_PATIENT_ID'].astype(str).str.contains('SP')
+    dataframe['FIELD_SID_OWNER_LASTNAME'] = owner.mask(other, 'GUEZGUEZ')
+    dataframe['FIELD_SID_ANIMAL_NAME'] = animal.mask(spleen, 'SPLEEN')
+
+#The keep-masks for rows and columns are computed on the raw dataframe, which is then
+#copied once into the cleaned one
 def clean_dataframe(dataframe):
-    copy = dataframe.copy()
-    
-    undesired_columns = ['ExpiredReagent', 'OPERATOR', 'PACKET_TYPE', 'QCFailed', 'SAMPLING_MODE', 'Archived', 'EOS#_EOS', 'ANALYSIS_TYPE', 'ANALYZER_NO', 'FIELD_SID_PATIENT_SEX', 'FIELD_SID_SAMPLE_TYPE', 'FIELD_SID_SESSIONID', 'VET_VERSION', 'XBDrift']
-    dataframe = dataframe.drop('InvalidAlarmStartup', axis=1)
-    dataframe = dataframe.drop('InvalidQC', axis=1)
-    columns = dataframe.columns
-    selected = [column for column in columns if ('raw' in column.lower() or 'valid' in column.lower())]
-    
-    counts = [np.unique(dataframe[column], return_counts=True) for column in selected]
-    invalid_raw = [(column, np.unique(dataframe[column], return_counts=True)) for column in selected if 'raw' in column.lower()]
-    invalid_occ = [column for (column, counts) in invalid_raw if '--.--' in counts[0]]
-    invalid_rows = [np.where(dataframe[column] == '--.--') for column in invalid_occ]
-    try:
-        indices = dataframe[dataframe[invalid_occ[0]] == '--.--'].index
-        dataframe.drop(indices, inplace=True)
-    except:
-        pass
-    dataframe.loc[dataframe['FIELD_SID_OWNER_LASTNAME'].isnull(), 'FIELD_SID_OWNER_LASTNAME'] = 'GUEZGUEZ'
-    dataframe.loc[dataframe['FIELD_SID_OWNER_LASTNAME'].str.isnumeric(), 'FIELD_SID_OWNER_LASTNAME'] = 'GUEZGUEZ'
-    dataframe.loc[(dataframe['FIELD_SID_OWNER_LASTNAME'] !='SCHUPPAN') & (dataframe['FIELD_SID_OWNER_LASTNAME'] !='GUEZGUEZ'), 'FIELD_SID_ANIMAL_NAME'] =  dataframe.loc[(dataframe['FIELD_SID_OWNER_LASTNAME'] !='SCHUPPAN') & (dataframe['FIELD_SID_OWNER_LASTNAME'] !='GUEZGUEZ'), 'FIELD_SID_OWNER_LASTNAME']
-    dataframe.loc[(dataframe['FIELD_SID_OWNER_LASTNAME'] !='SCHUPPAN') & (dataframe['FIELD_SID_OWNER_LASTNAME'] !='GUEZGUEZ'), 'FIELD_SID_OWNER_LASTNAME'] = 'GUEZGUEZ'
-    dataframe.loc[dataframe['FIELD_SID_ANIMAL_NAME'].isnull(), 'FIELD_SID_ANIMAL_NAME'] = 'BLOOD'
-    dataframe.loc[(dataframe['FIELD_SID_ANIMAL_NAME'] == 'SPL') | (dataframe['FIELD_SID_ANIMAL_NAME'] == 'SP') , 'FIELD_SID_ANIMAL_NAME'] = 'SPLEEN'
-    try:
-        dataframe.loc[dataframe['FIELD_SID_PATIENT_ID'].str.contains('|'.join(['SPL','SP']), case=True), 'FIELD_SID_ANIMAL_NAME'] = 'SPLEEN'
-    except:
-        pass
-    df = dataframe.copy()
-    for col in df:
-        unique = df[col].unique()
-        if df[col].isnull().all() or df[col].isna().all() or (len(unique) == 1 and unique[0] == '\n') or ('flag' in col.lower() and 'histogram' not in col.lower()) or '_Id' in col or 'Valid' in col or 'Raw' in col or 'Unit' in col:
-            df = df.drop(col, axis=1)
-    
-    df = df.drop(undesired_columns, axis=1)
+    rows = valid_rows(dataframe, invalid_column(dataframe))
+    columns = [column for column in dataframe.columns if not dropped_by_name(column)]
+    values, newlines = column_counts(dataframe, columns, rows)
+    count = len(dataframe) if rows is None else int(rows.sum())
+    return clean_rows(dataframe, rows, kept_columns(columns, values, newlines, count))
+
+#Cleaned copy of the given rows and columns, which were decided on this dataframe or, for a
+#chunked export, on all of its chunks (columns missing from this one are left empty)
+def clean_rows(dataframe, rows, columns):
+    present = [column for column in columns if column in dataframe]
+    df = dataframe.loc[rows, present] if rows is not None else dataframe[present].copy()
+    if len(present) < len(columns):
+        df = df.reindex(columns=columns)
+    if df.empty:
+        #Only failed measurements (e.g. a single '--.--' sample) ---> no row to fix up
+        return df
+    fix_owners(df)
     df['FIELD_SID_PATIENT_LAST_NAME'] = ''
 
     return df
@@ -131,6 +337,7 @@ def plot_rawdata(patient_id, feature, dataframe):
     dates = dataframe['ANALYSIS_DATE'][data_points.index]
     dates = [date.split(' ')[0] for date in dates.values]
     limits = [dataframe[feature.split('_')[0]+'_'+limit][data_points.index].values[0] for limit in ['LowLimit', 'HighLimit']]
+    import matplotlib.pyplot as plt
     plt.figure()
     plt.plot(dates, data_points, label=feature, ls=':')
     plt.xlabel('Date')
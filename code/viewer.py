@@ -0,0 +1,1080 @@
+#Dataset viewer (SecondWindow) and its dialogs. GUI.py imports this module when a dataset
+#is opened, the welcome window does not wait for pandas and the analysis modules.
+import os
+import numpy as np
+import pandas as pd
+from PyQt5 import QtCore, QtGui, QtWidgets
+import startup
+from manifest import drop_samples
+from dataset import dataset_filters, dataset_columns, viewer_columns, load_dataset, append_rows, date_format, sample_index, sample_rows, extend_sample_index, is_sqlite
+from ingest import append_files
+from sqlite_store import load_sqlite, sqlite_values
+from series import family_dict, families, family_series, group_statistics, PlotCache
+from metadata import read_metadata, update_metadata, join_metadata
+from workers import IngestWorker
+from profiling import span, profiled
+import profiling
+startup.mark('viewer modules imported')
+
+colors = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (0.5, 0, 0.5)]
+
+#Table model reading the dataframe's column arrays, the view only asks for the visible
+#cells. Sorting and filtering work on row positions, the data itself is never copied.
+class DataFrameModel(QtCore.QAbstractTableModel):
+    def __init__(self, dataframe, parent=None):
+        super().__init__(parent)
+        self.columns = [str(column) for column in dataframe.columns]
+        self.arrays = [dataframe.iloc[:, idx].to_numpy() for idx in range(dataframe.shape[1])]
+        self.labels = dataframe.index.to_numpy()
+        self.order = np.arange(dataframe.shape[0])
+        self.rows = self.order
+        self.mask = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        value = self.arrays[index.column()][self.rows[index.row()]]
+        if isinstance(value, np.datetime64):
+            value = pd.Timestamp(value)
+        return str(value)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+        return str(self.labels[self.rows[section]])
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        if column < 0:
+            self.order = np.arange(len(self.labels))
+        else:
+            values = pd.Series(self.arrays[column])
+            self.order = values.sort_values(ascending=order == QtCore.Qt.AscendingOrder, kind='stable',
+                                            na_position='last').index.to_numpy()
+        self.update_rows()
+        self.layoutChanged.emit()
+
+    #Rows whose value in column contains text (case insensitive), an empty text shows every row
+    def set_filter(self, column, text):
+        self.beginResetModel()
+        if text:
+            values = pd.Series(self.arrays[column]).astype(str)
+            self.mask = values.str.contains(text, case=False, regex=False).to_numpy()
+        else:
+            self.mask = None
+        self.update_rows()
+        self.endResetModel()
+
+    def update_rows(self):
+        self.rows = self.order if self.mask is None else self.order[self.mask[self.order]]
+
+class TableWindow(QtWidgets.QMainWindow):
+    def __init__(self, dataframe, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.widget = QtWidgets.QWidget()
+        self.layout = QtWidgets.QVBoxLayout()
+        self.datatable = QtWidgets.QTableView()
+
+        self.main_df = dataframe
+        self.model = DataFrameModel(self.main_df, self)
+        self.datatable.setModel(self.model)
+        #No sort indicator ---> the rows keep the dataframe order until a header is clicked
+        self.datatable.horizontalHeader().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        self.datatable.setSortingEnabled(True)
+        self.datatable.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+
+        self.filter_column = QtWidgets.QComboBox()
+        self.filter_column.addItems(self.model.columns)
+        self.filter_text = QtWidgets.QLineEdit()
+        self.filter_text.setPlaceholderText('Filter rows (press Enter)')
+        self.filter_text.returnPressed.connect(self.apply_filter)
+        self.filter_layout = QtWidgets.QHBoxLayout()
+        self.filter_layout.addWidget(self.filter_column)
+        self.filter_layout.addWidget(self.filter_text)
+
+        self.layout.addLayout(self.filter_layout)
+        self.layout.addWidget(self.datatable)
+        self.widget.setLayout(self.layout)
+        self.setCentralWidget(self.widget)
+
+        self.setWindowTitle("Dataframe")
+        self.resize(480,480)
+        self.show()
+
+    def apply_filter(self):
+        self.model.set_filter(self.filter_column.currentIndex(), self.filter_text.text())
+
+#Profiling spans of this session (Window > Performance). Recording is switched on and off
+#here, the table shows the totals per span name or every span and can be exported.
+class PerformanceWindow(QtWidgets.QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Performance')
+        self.resize(820, 420)
+
+        self.record_box = QtWidgets.QCheckBox('Record spans')
+        self.record_box.setChecked(profiling.enabled)
+        self.record_box.setToolTip('Measure the ingest stages and the plots from now on.')
+        self.record_box.toggled.connect(profiling.enable)
+        self.totals_box = QtWidgets.QCheckBox('Totals per span')
+        self.totals_box.setChecked(True)
+        self.totals_box.toggled.connect(self.refresh)
+        self.clear_button = QtWidgets.QPushButton('Clear')
+        self.clear_button.clicked.connect(self.clear)
+        self.export_button = QtWidgets.QPushButton('Export')
+        self.export_button.setToolTip('Save every span as json or csv.')
+        self.export_button.clicked.connect(self.export)
+        self.table = QtWidgets.QTableWidget()
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(self.record_box)
+        buttons.addWidget(self.totals_box)
+        buttons.addStretch()
+        buttons.addWidget(self.clear_button)
+        buttons.addWidget(self.export_button)
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(buttons)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+        #Spans of the ingest worker and of the plots show up while the panel is open
+        self.shown = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.update_table)
+        self.timer.start(1000)
+        self.refresh()
+
+    def update_table(self):
+        if len(profiling.records) != self.shown:
+            self.refresh()
+
+    def refresh(self):
+        records = profiling.snapshot()
+        self.shown = len(records)
+        if self.totals_box.isChecked():
+            records = profiling.summary(records)
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        self.table.clear()
+        self.table.setRowCount(len(records))
+        self.table.setColumnCount(len(columns))
+        self.table.setHorizontalHeaderLabels(columns)
+        for row, record in enumerate(records):
+            for column, key in enumerate(columns):
+                value = record.get(key)
+                text = '' if value is None else '{:.3f}'.format(value) if isinstance(value, float) else str(value)
+                self.table.setItem(row, column, QtWidgets.QTableWidgetItem(text))
+
+    def clear(self):
+        profiling.reset()
+        self.refresh()
+
+    def export(self):
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save as', os.path.dirname(os.path.abspath(__file__)),
+                                                            "JSON (*.json);;Comma-separated values (*.csv)")
+        if filename != '':
+            profiling.export(filename)
+
+
+#Class wrapper for multi-item combo box
+class CheckableComboBox(QtWidgets.QComboBox):
+    def __init__(self):
+        super(CheckableComboBox, self).__init__()
+        self.view().pressed.connect(self.handleItemPressed)
+        self.setModel(QtGui.QStandardItemModel(self))
+        self.setEditable(True) #check if this is really True
+        self.lineEdit().setReadOnly(True)
+        palette = QtWidgets.qApp.palette()
+        palette.setBrush(QtGui.QPalette.Base, palette.button())
+        self.lineEdit().setPalette(palette)
+        self.selected_items = []
+
+    def handleItemPressed(self, index):
+        item = self.model().itemFromIndex(index)
+        if item.checkState() == QtCore.Qt.CheckState.Checked:
+            item.setCheckState(QtCore.Qt.CheckState.Unchecked)
+            try:
+                self.selected_items.remove(index.data())
+            except:
+                pass
+        else:
+            item.setCheckState(QtCore.Qt.CheckState.Checked)
+            self.selected_items.append(item.text())
+        if len(self.selected_items)>0:
+            self.setCurrentText(', '.join(self.selected_items))
+        #print(self.selected_items)
+    
+    def setCurrentText(self, text):
+        self.lineEdit().setText(text)
+
+class WelcomeDialog(QtWidgets.QDialog):
+    def __init__(self, parent = None, *args, **kwargs):
+        super().__init__(parent)
+        location = os.path.dirname(os.path.realpath(__file__))
+        self.setWindowIcon(QtGui.QIcon(os.path.join(location, 'BloodAnalyzerIcon.png')))
+        self.setWindowTitle('Welcome')
+        
+        # Add the logo to the message box
+        logo_label = QtWidgets.QLabel()
+        logo_pixmap = QtGui.QPixmap(os.path.join(location, 'BloodAnalyzer_Logo.png'))  # Replace "path/to/your/logo.png" with the actual path to your logo
+        logo_label.setPixmap(logo_pixmap)
+        logo_label.setAlignment(QtCore.Qt.AlignCenter)
+
+        # Add welcome message to the layout
+        welcome_label = QtWidgets.QLabel(self)
+        welcome_label.setText("Welcome to BAS!")
+        welcome_label.setAlignment(QtCore.Qt.AlignCenter)
+        
+        # Add instructions to the layout
+        instructions_label = QtWidgets.QLabel(self)
+        instructions_label.setText('Here are some brief instructions to get you started:\n\n1.'+
+                                   'Select patients IDs of interest.\n2. Select a blood test.\n3.'+
+                                   'Select the features family of interest.\n4. Filter the timeseries by the patient ID and dates.\n5.' 
+                                   'Additionally, you can import metadata and generate a boxplot according to the desired values.')
+        instructions_label.setAlignment(QtCore.Qt.AlignCenter)   
+        #'<a href="https://github.com/your_username/your_repository">Click here to visit the GitHub repository</a>'
+        #Add link to the Github repo
+        link_label = QtWidgets.QLabel()
+        link_label.setText('For more information and detailed usage examples, please visit our '+
+                               '<a href="https://github.com/jazg97/BloodAnalyzerSoftware">GitHub repository</a>.')
+        link_label.setAlignment(QtCore.Qt.AlignCenter)
+        link_label.setOpenExternalLinks(True)
+        link_label.setTextInteractionFlags(QtCore.Qt.TextBrowserInteraction)
+        #self.info_box.addWidget(QtWidgets.QMessageBox.Ok)
+        
+        message_layout = QtWidgets.QVBoxLayout()
+        message_layout.addWidget(logo_label)
+        message_layout.addWidget(welcome_label)
+        message_layout.addWidget(instructions_label)
+        message_layout.addWidget(link_label)
+        #message_layout.addWidget(QtWidgets.QMessageBox.Ok)
+        
+        self.setLayout(message_layout)        
+
+class SimpleSelectionWindow(QtWidgets.QDialog):
+    def __init__(self, parent=None, items = None , sel= None ,label = None, *args, **kwargs):
+    
+        super(SimpleSelectionWindow, self).__init__(parent)
+        
+        self.setWindowTitle('Select '+label)
+        
+        self.finish_button = QtWidgets.QPushButton("Finish")
+        self.finish_button.setFixedSize(200,60)
+        self.finish_button.clicked.connect(self.close)
+        
+        self.items = [item for item in list(items) if item not in sel]
+        self.selected_items = sel
+        
+        self.initial_list_widget = QtWidgets.QListWidget()
+        self.initial_list_widget.addItems(self.items)
+        self.initial_list_widget.itemClicked.connect(self.update_list)
+        
+        self.selected_list_widget= QtWidgets.QListWidget()
+        self.selected_list_widget.addItems(self.selected_items)
+        
+        self.add_button = QtWidgets.QPushButton(">>")
+        self.add_button.setToolTip("Select an Item")
+        self.add_button.clicked.connect(self.select_item)
+        
+        self.remove_button = QtWidgets.QPushButton("<<")
+        self.remove_button.setToolTip("Deselect an Item")
+        self.remove_button.clicked.connect(self.reset_item)
+        
+        self.button_layout = QtWidgets.QVBoxLayout()
+        self.button_layout.addWidget(self.add_button)
+        self.button_layout.addWidget(self.remove_button)
+        
+        self.initial_box = QtWidgets.QVBoxLayout()
+        self.initial_label = QtWidgets.QLabel("Available "+ label)
+        self.initial_box.addWidget(self.initial_label)
+        self.initial_box.addWidget(self.initial_list_widget)
+        
+        self.selected_box = QtWidgets.QVBoxLayout()
+        self.selected_label = QtWidgets.QLabel("Selected " + label)
+        self.selected_box.addWidget(self.selected_label)
+        self.selected_box.addWidget(self.selected_list_widget)
+        
+        self.list_layout = QtWidgets.QHBoxLayout()
+        self.list_layout.addLayout(self.initial_box, stretch = 2)
+        self.list_layout.addLayout(self.button_layout, stretch = 1)
+        self.list_layout.addLayout(self.selected_box, stretch = 2)
+        
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(self.list_layout, stretch = 1)
+        self.main_layout.addWidget(self.finish_button, stretch = 1)
+        
+        self.main_layout.setAlignment(self.finish_button, QtCore.Qt.AlignHCenter)
+        
+        self.setLayout(self.main_layout)
+    
+    def update_list(self, item):
+        pass
+    
+    def select_item(self):
+    
+        item = self.initial_list_widget.currentItem()
+        if item is None:
+            return
+        self.initial_list_widget.takeItem(self.initial_list_widget.row(item))
+        self.selected_list_widget.addItem(item.text())
+        self.selected_items.append(item.text())
+        self.items.remove(item.text())
+    
+    def reset_item(self):
+            
+        item = self.selected_list_widget.currentItem()
+        if item is None:
+            return
+        self.selected_list_widget.takeItem(self.selected_list_widget.row(item))
+        self.initial_list_widget.addItem(item.text())
+        self.selected_items.remove(item.text())
+        self.items.append(item.text())
+
+class ListSelectionWindow(QtWidgets.QDialog):
+    def __init__(self, parent=None, patients_dict=None, *args, **kwargs):
+        super(ListSelectionWindow, self).__init__(parent)
+
+        self.setWindowTitle("Filter Series by Dates")
+        self.setGeometry(100, 100, 850, 300)
+
+        self.list_selection_button = QtWidgets.QPushButton("Update Plot")
+        self.list_selection_button.setFixedSize(200, 60)
+        self.list_selection_button.clicked.connect(self.close)
+        
+        self.patients = patients_dict
+        
+        self.removed_dates = {key: [] for key in self.patients.keys()}
+
+        # create list widgets
+        self.available_list_widget = QtWidgets.QListWidget()
+        self.available_list_widget.addItems(list(self.patients.keys()))
+        self.available_list_widget.itemClicked.connect(self.update_date_list)
+
+        self.second_list_widget = QtWidgets.QListWidget()
+        self.second_selected_list_widget = QtWidgets.QListWidget()        
+
+        # create button to move items from available list to selected list
+        self.add_button2 = QtWidgets.QPushButton(">>")
+        self.add_button2.setToolTip('Remove a Date')
+        self.add_button2.clicked.connect(self.select_second_item)
+
+        # create button to move items from selected list to available list
+        self.remove_button2 = QtWidgets.QPushButton("<<")
+        self.remove_button2.setToolTip('Reinsert a Date')
+        self.remove_button2.clicked.connect(self.reset_second_item)
+
+        self.button_layout2 = QtWidgets.QVBoxLayout()
+        self.button_layout2.addWidget(self.add_button2)
+        self.button_layout2.addWidget(self.remove_button2)
+
+        self.current_box = QtWidgets.QVBoxLayout()
+        self.current_label = QtWidgets.QLabel("Selected IDs")
+        self.current_box.addWidget(self.current_label)
+        self.current_box.addWidget(self.available_list_widget)
+        
+        self.second_current_box = QtWidgets.QVBoxLayout()
+        self.second_current_label = QtWidgets.QLabel("Selected Sample Dates")
+        self.second_current_box.addWidget(self.second_current_label)
+        self.second_current_box.addWidget(self.second_list_widget)
+        
+        self.second_removed_box = QtWidgets.QVBoxLayout()
+        self.second_removed_label = QtWidgets.QLabel("Removed Sample Dates")
+        self.second_removed_box.addWidget(self.second_removed_label)
+        self.second_removed_box.addWidget(self.second_selected_list_widget)
+
+        # create layout for lists
+        self.list_layout = QtWidgets.QHBoxLayout()
+        self.list_layout.addLayout(self.current_box, stretch = 2)
+        self.list_layout.addLayout(self.second_current_box, stretch = 2)
+        self.list_layout.addLayout(self.button_layout2, stretch = 1)
+        self.list_layout.addLayout(self.second_removed_box, stretch = 2)
+
+        # create main layout for window
+        self.main_layout = QtWidgets.QVBoxLayout()
+        self.main_layout.addLayout(self.list_layout, stretch = 1)
+        self.main_layout.addWidget(self.list_selection_button, stretch = 1)
+
+        self.main_layout.setAlignment(self.list_selection_button, QtCore.Qt.AlignHCenter)
+
+        self.setLayout(self.main_layout)
+    
+    def update_date_list(self, id_item):
+        
+        self.second_list_widget.clear()
+        self.second_selected_list_widget.clear()
+        dates = self.patients[id_item.text()]
+        removed = self.removed_dates[id_item.text()]
+        self.second_list_widget.addItems(dates)
+        self.second_selected_list_widget.addItems(removed)
+        
+    def select_second_item(self):
+        item = self.second_list_widget.currentItem()
+        id_item   = self.available_list_widget.currentItem()
+        if item is None:
+            return
+        self.second_list_widget.takeItem(self.second_list_widget.row(item))
+        self.second_selected_list_widget.addItem(item.text())
+        self.removed_dates[id_item.text()].append(item.text())
+        self.patients[id_item.text()].remove(item.text())
+
+    def reset_second_item(self):
+        item = self.second_selected_list_widget.currentItem()
+        id_item = self.available_list_widget.currentItem()
+        if item is None:
+            return
+        self.second_selected_list_widget.takeItem(self.second_selected_list_widget.row(item))
+        self.second_list_widget.addItem(item.text())
+        self.removed_dates[id_item.text()].remove(item.text())
+        self.patients[id_item.text()].append(item.text())
+
+#Class wrapper for Dialog test window
+class SecondWindow(QtWidgets.QMainWindow):
+    signal = QtCore.pyqtSignal(str)
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.root = '\\'.join(os.path.dirname(os.path.realpath(__file__)).split('\\')[:-1])
+        location = os.path.dirname(os.path.realpath(__file__))
+
+        self.filename = filename
+        self.new_file = None
+        #Histogram and threshold strings are not needed to explore the data and stay on disk
+        self.columns = viewer_columns(dataset_columns(self.filename))
+        if is_sqlite(self.filename):
+            #SQLite dataset ---> nothing is loaded up front, every selection is a query that
+            #reads only its samples through the patient/sample type index
+            self.dataframe = None
+            self.sample_index = None
+            self.unique_ids = np.array(sqlite_values(self.filename, 'FIELD_SID_PATIENT_ID'), dtype=str)
+            sample_types = sqlite_values(self.filename, 'FIELD_SID_ANIMAL_NAME')
+        else:
+            self.dataframe = load_dataset(self.filename, columns=self.columns)
+            self.unique_ids = np.sort(self.dataframe['FIELD_SID_PATIENT_ID'].dropna().unique().astype(str))
+            self.sample_index = sample_index(self.dataframe)
+            sample_types = sorted(self.dataframe['FIELD_SID_ANIMAL_NAME'].dropna().unique())
+        startup.mark('dataset loaded')
+        #Prepared plot data per selection, cleared whenever the dataset changes
+        self.plot_cache = PlotCache()
+        self.selected_ids = []
+
+        self.features = sorted([column.split('_')[0] for column in self.columns
+                                if 'Value' in column])
+
+        root_layout = QtWidgets.QHBoxLayout()
+        myQWidget = QtWidgets.QWidget()
+
+        first_column = QtWidgets.QVBoxLayout()
+        self.second_column = QtWidgets.QVBoxLayout()
+        myQWidget.setLayout(root_layout)
+        self.setCentralWidget(myQWidget)
+        
+        subsection_font = QtGui.QFont()
+        subsection_font.setBold(True)
+        subsection_font.setUnderline(True)
+        subsection_font.setPointSize(16)
+        
+        label_font = QtGui.QFont()
+        label_font.setBold(True)
+        label_font.setUnderline(False)
+        label_font.setPointSize(12)
+        
+        self.menubar = self.menuBar()
+        self.file_menu = self.menubar.addMenu('File')
+        self.edit_menu = self.menubar.addMenu('Window')
+        self.data_menu = self.menubar.addMenu('Data')
+        self.import_menu= self.menubar.addMenu('Import')
+        self.export_menu = self.menubar.addMenu('Export')
+        self.help_menu = self.menubar.addMenu('Help')
+        
+        self.open_action = QtWidgets.QAction('Open Dataset File', self)
+        self.file_menu.addAction(self.open_action)
+        self.open_action.triggered.connect(self.open_file)
+        
+        self.reset_action = QtWidgets.QAction('Reset Window', self)
+        self.reset_action.triggered.connect(self.reset_window)
+        self.edit_menu.addAction(self.reset_action)
+        self.performance_action = QtWidgets.QAction('Performance', self)
+        self.performance_action.triggered.connect(self.show_performance)
+        self.edit_menu.addAction(self.performance_action)
+        
+        self.showAll_action = QtWidgets.QAction('Show All Dataframe', self)
+        self.showAll_action.triggered.connect(self.show_all_dataframe)
+        self.data_menu.addAction(self.showAll_action)
+        self.showSel_action = QtWidgets.QAction('Show Selected Dataframe', self)
+        self.data_menu.addAction(self.showSel_action)
+        self.showSel_action.triggered.connect(self.show_sel_dataframe)
+        
+        self.importNew_action = QtWidgets.QAction('Import New xml Files', self)
+        self.import_menu.addAction(self.importNew_action)
+        self.importNew_action.triggered.connect(self.add_rows)
+        self.importMeta_action= QtWidgets.QAction('Import Metadata', self)
+        self.importMeta_action.triggered.connect(self.import_data)
+        self.import_menu.addAction(self.importMeta_action)
+        
+        self.exportSel_action = QtWidgets.QAction('Exported Selected Data', self)
+        self.export_menu.addAction(self.exportSel_action)
+        self.exportSel_action.triggered.connect(self.export_selection)
+        self.exportAll_action = QtWidgets.QAction('Export Dataset as csv', self)
+        self.export_menu.addAction(self.exportAll_action)
+        self.exportAll_action.triggered.connect(self.export_dataset)
+        
+        self.getHelp_action = QtWidgets.QAction('Show B.A.S Instructions')
+        self.help_menu.addAction(self.getHelp_action)
+        self.getHelp_action.triggered.connect(self.open_HelpDialog)
+        
+        self.column_label = QtWidgets.QLabel(self)
+        self.column_label.setText('Filter Options')
+        self.column_label.setFont(subsection_font)
+        self.column_label.setToolTip('Select and Filter Data to plot.') 
+
+        self.first_label = QtWidgets.QLabel(self)
+        self.first_label.setText('1) Patient ID Selection')
+        self.first_label.setFont(label_font)
+        
+        self.second_label = QtWidgets.QLabel(self)
+        self.second_label.setText('2) Blood Source Selection')
+        self.second_label.setFont(label_font)
+        
+        self.third_label = QtWidgets.QLabel(self)
+        self.third_label.setText('3) Feature Selection')
+        self.third_label.setFont(label_font)
+        
+        self.fourth_label = QtWidgets.QLabel(self)
+        self.fourth_label.setText('4) Filter by Date')
+        self.fourth_label.setFont(label_font)
+        
+        self.meta_label = QtWidgets.QLabel(self)
+        self.meta_label.setText('5) Metadata Selection')
+        self.meta_label.setFont(label_font)
+        
+        self.plot_button = QtWidgets.QPushButton("Generate Plot")
+        self.plot_button.setToolTip('Generate Timeseries Plot based on ID, Feature Family & Blood Test.')
+        #Built with the first plot, see build_canvas
+        self.canvas = None
+        self.toolbar = None
+        
+        self.feature_buttonGroup = QtWidgets.QButtonGroup(self)
+        self.feature_groupbox = QtWidgets.QGroupBox('Feature Options')
+        self.feature_groupbox.setStyleSheet("QGroupBox { background-color: #f0f0f0; }")
+        self.feature_vbox  = QtWidgets.QVBoxLayout()
+
+        self.feature_checkbox = [QtWidgets.QCheckBox(feature, self) for feature in families]
+        _ = [(self.feature_buttonGroup.addButton(checkbox), self.feature_vbox.addWidget(checkbox))  for checkbox in self.feature_checkbox]
+        self.feature_groupbox.setLayout(self.feature_vbox)
+        self.feature_buttonGroup.setExclusive(True)
+        
+        self.test_buttonGroup = QtWidgets.QButtonGroup(self)
+        self.test_groupbox = QtWidgets.QGroupBox('Blood Sources')
+        self.test_vbox  = QtWidgets.QVBoxLayout()
+
+        self.test_checkbox = [QtWidgets.QCheckBox(blood, self) for blood in sample_types]
+        _ = [(self.test_buttonGroup.addButton(checkbox), self.test_vbox.addWidget(checkbox))  for checkbox in self.test_checkbox]
+        self.test_groupbox.setLayout(self.test_vbox)
+        self.test_buttonGroup.setExclusive(True)
+        self.test_groupbox.setFlat(False)
+        
+        self.selectId_button = QtWidgets.QPushButton('Select Patients IDs')
+        self.selectId_button.setToolTip("Show Pop-up Window to Select IDs")
+        
+        self.date_button = QtWidgets.QPushButton('Filter Series by Date')
+        self.date_button.setToolTip('Show Pop-up Window to Remove Datapoints by Date and ID.')
+        
+        self.selectMeta_button = QtWidgets.QPushButton('Select Metadata Fields')
+        self.selectMeta_button.setToolTip('Show Pop-up Window to Select Metadata Fields')
+        
+        self.table_window= None
+        self.selected_frame = None
+        self.metadata = None
+        self.popup_window = None
+        self.id_window = None
+        self.meta_window = None
+        self.selected_fields = []
+        self.desired_size = (1620, 980)
+
+        self.worker = None
+        self.ingest_progress = QtWidgets.QProgressBar()
+        self.ingest_progress.setFixedWidth(250)
+        self.ingest_progress.setVisible(False)
+        self.ingest_cancel = QtWidgets.QPushButton('Cancel')
+        self.ingest_cancel.setToolTip('Stop importing the xml files.')
+        self.ingest_cancel.setVisible(False)
+        self.ingest_cancel.clicked.connect(self.cancel_ingest)
+        self.statusBar().addPermanentWidget(self.ingest_progress)
+        self.statusBar().addPermanentWidget(self.ingest_cancel)
+        
+        self.meta_groupbox = QtWidgets.QGroupBox('Metadata Plotting Options')
+
+        self.global_radio = QtWidgets.QRadioButton('Global Metrics')
+        self.global_radio.setChecked(False)
+        self.time_radio   = QtWidgets.QRadioButton('Time-series')
+        self.time_radio.setChecked(False)
+
+        self.contained_box = QtWidgets.QHBoxLayout()
+        self.contained_box.addWidget(self.global_radio)
+        self.contained_box.addWidget(self.time_radio)
+        
+        self.meta_groupbox.setLayout(self.contained_box)
+        #self.feature_buttonGroup.setExclusive(True)
+
+        self.stat_button = QtWidgets.QPushButton('Generate Scatter Plot')
+        self.stat_button.setToolTip('Generate Global or Time-based Boxplot based on Metadata.')
+        
+        self.warning_box = QtWidgets.QMessageBox()
+        self.warning_box.setIcon(QtWidgets.QMessageBox.Warning)
+        self.warning_box.setWindowTitle('Warning')
+        self.warning_box.addButton(QtWidgets.QMessageBox.Ok)
+        
+        self.welcome_dialog = None
+        self.performance_window = None
+        
+        self.reset_button = QtWidgets.QPushButton('Reset Window')
+        
+        first_column.addStretch()
+        first_column.addWidget(self.column_label)
+        first_column.addWidget(self.first_label, stretch = 2)
+        first_column.addWidget(self.selectId_button, stretch = 1)
+        first_column.addWidget(self.second_label, stretch = 2)
+        first_column.addWidget(self.test_groupbox, stretch = 1)
+        first_column.addWidget(self.third_label, stretch = 2)
+        first_column.addWidget(self.feature_groupbox, stretch = 1)
+        first_column.addWidget(self.fourth_label, stretch = 2)
+        first_column.addWidget(self.date_button, stretch = 1)
+        first_column.addWidget(self.meta_label, stretch = 2)
+        first_column.addWidget(self.selectMeta_button, stretch = 1)
+        first_column.addWidget(self.meta_groupbox, stretch = 1)
+        first_column.addStretch()
+        first_column.addWidget(self.plot_button)
+        first_column.addWidget(self.stat_button)
+
+        root_layout.addLayout(first_column)
+        root_layout.addLayout(self.second_column)
+        self.selectMeta_button.setEnabled(False)
+        self.global_radio.setEnabled(False)
+        self.time_radio.setEnabled(False)
+        self.meta_groupbox.setEnabled(False)
+        self.stat_button.setEnabled(False)
+        self.fourth_label.setEnabled(False)
+        self.meta_label.setEnabled(False)
+        self.meta_groupbox.setEnabled(False)
+
+        self.plot_button.clicked.connect(self.gen_plot)
+        self.stat_button.clicked.connect(self.generate_boxplot)
+        self.date_button.clicked.connect(self.show_datePopup)
+        self.selectId_button.clicked.connect(self.select_items)
+        self.selectMeta_button.clicked.connect(self.select_fields)
+        
+        self.setWindowIcon(QtGui.QIcon(os.path.join(location, 'BloodAnalyzerIcon.png')))
+        self.setWindowTitle("B.A.S.")
+        
+        print(self.size())
+        startup.mark('viewer window built')
+
+    #The canvas and its toolbar are built (and matplotlib imported) for the first plot
+    def build_canvas(self):
+        if self.canvas is None:
+            from canvas import MplCanvas, NavigationToolbar
+            self.canvas = MplCanvas(self, dpi=100)
+            self.toolbar = NavigationToolbar(self.canvas, self)
+            self.toolbar.setVisible(False)
+            self.canvas.setVisible(False)
+            self.second_column.addWidget(self.toolbar)
+            self.second_column.addWidget(self.canvas)
+            startup.mark('plot canvas built')
+    
+    def open_file(self):
+    
+        file, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select a file",
+                                                            os.path.dirname(os.path.abspath(__file__)),
+                                                            dataset_filters)
+        
+        
+        if file !='':
+            self.new_file = file
+            self.signal.emit('Change SecondWindow file')
+            #print(self.new_file)
+            self.close()
+    
+    def add_rows(self):
+        
+        filenames, _ = QtWidgets.QFileDialog.getOpenFileNames(self, "Select file(s)",
+                                                        os.path.dirname(os.path.abspath(__file__)),
+                                                        "Extensible Markup Language (*.xml)")
+        
+        if filenames:
+            #The files are parsed and written in a worker thread, rows_added updates the view
+            self.importNew_action.setEnabled(False)
+            self.ingest_progress.setValue(0)
+            self.ingest_progress.setVisible(True)
+            self.ingest_cancel.setVisible(True)
+            self.statusBar().showMessage('Importing xml files...')
+            self.worker = IngestWorker(append_files, filenames, self.filename)
+            self.worker.maximum.connect(self.ingest_progress.setMaximum)
+            self.worker.progress.connect(self.ingest_progress.setValue)
+            self.worker.done.connect(self.rows_added)
+            self.worker.stopped.connect(self.ingest_finished)
+            self.worker.failed.connect(self.ingest_failed)
+            self.worker.start()
+
+    def rows_added(self, result):
+        clean_df, stale = result
+        if clean_df is not None and self.dataframe is None:
+            #The rows are already in the database, only the patient list changes
+            self.unique_ids = np.array(sqlite_values(self.filename, 'FIELD_SID_PATIENT_ID'), dtype=str)
+            self.plot_cache.clear()
+        elif clean_df is not None:
+            offset = len(self.dataframe)
+            if stale:
+                self.dataframe = drop_samples(self.dataframe, stale).reset_index(drop=True)
+            self.dataframe = append_rows(self.dataframe, clean_df)
+            self.unique_ids = np.sort(self.dataframe['FIELD_SID_PATIENT_ID'].dropna().unique().astype(str))
+            #Replaced rows shift the positions of the following ones, only then is the index rebuilt
+            if stale:
+                self.sample_index = sample_index(self.dataframe)
+            else:
+                self.sample_index = extend_sample_index(self.sample_index, clean_df, offset)
+            self.plot_cache.clear()
+        self.ingest_finished()
+
+    def cancel_ingest(self):
+        if self.worker is not None:
+            self.statusBar().showMessage('Cancelling...')
+            self.worker.cancel()
+
+    def ingest_finished(self):
+        self.ingest_progress.setVisible(False)
+        self.ingest_cancel.setVisible(False)
+        self.statusBar().clearMessage()
+        self.importNew_action.setEnabled(True)
+
+    def ingest_failed(self, message):
+        self.ingest_finished()
+        QtWidgets.QMessageBox.warning(self, "B.A.S.", "The xml files could not be imported:\n"+message)
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.stop()
+        super().closeEvent(event)
+    
+    def show_performance(self):
+        if self.performance_window is None:
+            self.performance_window = PerformanceWindow(self)
+        self.performance_window.show()
+        self.performance_window.raise_()
+
+    def open_HelpDialog(self):
+        self.welcome_dialog = WelcomeDialog()
+        self.welcome_dialog.exec_()
+    
+    def get_checkedItem(self, buttonGroup):
+    
+        checked_id = buttonGroup.checkedId()
+        checked_button = buttonGroup.button(checked_id)
+        checked_text = checked_button.text()        
+        return checked_text
+    
+    #Rows of the selected patients for one sample type (all of its rows without selection)
+    def select_samples(self, patient_ids, sample_type):
+        if self.dataframe is None:
+            return load_sqlite(self.filename, self.columns, patient_ids, sample_type)
+        if not len(patient_ids):
+            return self.dataframe[self.dataframe['FIELD_SID_ANIMAL_NAME'] == sample_type]
+        return self.dataframe.iloc[sample_rows(self.sample_index, patient_ids, sample_type)]
+
+    def with_metadata(self, dataframe):
+        return dataframe if self.metadata is None else join_metadata(dataframe, self.metadata)
+
+    def select_items(self):
+        
+        self.id_window = SimpleSelectionWindow(parent=None, items=self.unique_ids, sel=self.selected_ids, label='IDs')
+        self.id_window.exec_()
+        
+        self.selected_ids = self.id_window.selected_items
+    
+    def select_fields(self):
+        
+        self.meta_window = SimpleSelectionWindow(parent=None, items=list(self.metadata.columns), sel=[], label='Metadata Fields')
+        self.meta_window.exec_()
+        
+        self.selected_fields = self.meta_window.selected_items        
+
+    def show_datePopup(self):
+    
+        selected_test = self.get_checkedItem(self.test_buttonGroup)
+        patient_ids = sorted(self.selected_ids, key = lambda x: x.split(' ')[-1])#[patient.split(' ')[-1] for patient in sorted(self.id_box.selected_items)]
+        patient_ids = [id.split(' ')[-1] for id in patient_ids]
+        
+        patient_df = self.select_samples(patient_ids, selected_test)
+        
+        dates = patient_df['ANALYSIS_DATE'].dt.strftime(date_format)
+        patient_dict = {patient: group.tolist() for patient, group in dates.groupby(patient_df['FIELD_SID_PATIENT_ID'], observed=True)}
+        
+        self.popup_window = ListSelectionWindow(parent=None, patients_dict= patient_dict)
+        
+        self.popup_window.exec_()
+        
+        modified_dict = self.popup_window.patients
+        
+        modified_set = set((key, date) for key, dates in modified_dict.items() for date in dates)
+        filtered_df = patient_df[[key in modified_set for key in zip(patient_df['FIELD_SID_PATIENT_ID'], dates)]]
+        
+        self.filtered_plot(filtered_df, patient_ids, frozenset(modified_set))
+        
+        current_size = self.size()
+        
+        if current_size.width() < self.desired_size[0] or current_size.height() < self.desired_size[1]:
+            self.resize(*self.desired_size)
+        
+        #self.resize(1620, 980)
+
+    def gen_plot(self):
+    
+        selected_feature = self.get_checkedItem(self.feature_buttonGroup)
+        selected_test = self.get_checkedItem(self.test_buttonGroup)
+        
+        print("Selected Patients:", self.selected_ids)
+        print("Selected Family:", selected_feature)
+        print("Selected Tests:", selected_test)
+
+        patient_ids = sorted(self.selected_ids, key = lambda x: x.split(' ')[-1])#[patient.split(' ')[-1] for patient in sorted(self.id_box.selected_items)]
+        patient_ids = [id.split(' ')[-1] for id in patient_ids]
+
+        self.build_canvas()
+        self.toolbar.setVisible(True)
+        self.canvas.setVisible(True)
+        self.fourth_label.setEnabled(True)
+        
+        self.filtered_plot(self.dataframe, patient_ids)
+        current_size = self.size()
+        
+        if current_size.width() < self.desired_size[0] or current_size.height() < self.desired_size[1]:
+            self.resize(*self.desired_size)
+
+    def show_warning_message(self, warning_list, selected_test):
+
+        if len(warning_list)==1:
+            self.warning_box.setText('Patient ID #'+str(warning_list[0])+" has no "+selected_test+" samples." +'\n' + 'Try with another patients ID.')
+            self.warning_box.exec_()
+        elif len(warning_list)>1:
+            self.warning_box.setText('Patients IDs #'+str(','.join(warning_list))+" have no "+selected_test+" samples." +'\n' + 'Try with another patients ID.')
+            self.warning_box.exec_()
+    
+    
+    #date_filter identifies the (patient, date) pairs kept in dataframe, None for all of them.
+    #dataframe is None for SQLite datasets, the selection is then read from the database
+    @profiled('timeseries plot')
+    def filtered_plot(self, dataframe, patient_ids, date_filter=None):
+    
+        selected_test = self.get_checkedItem(self.test_buttonGroup)
+        selected_feature = self.get_checkedItem(self.feature_buttonGroup)
+        features = family_dict[selected_feature]
+        
+        warning_list = []
+        self.build_canvas()
+        self.canvas.fig.clf()
+        self.canvas.axs = []
+        axis = None
+        key = ('series', tuple(patient_ids), selected_feature, selected_test, date_filter)
+        series = self.plot_cache.get(key)
+        if series is None:
+            if dataframe is None:
+                #SQLite dataset ---> only the samples of the selection are read
+                dataframe = self.select_samples(patient_ids, selected_test)
+            index = self.sample_index if dataframe is self.dataframe else sample_index(dataframe)
+            with span('series', patients=len(patient_ids)) as counts:
+                patient_rows = {patient: sample_rows(index, [patient], selected_test) for patient in patient_ids}
+                counts['rows'] = sum(len(rows) for rows in patient_rows.values())
+                series = self.plot_cache.put(key, family_series(dataframe, patient_rows, features))
+        
+        for idx,feature in enumerate(features):
+            self.canvas.axs.append(axis)
+            if selected_feature =='WBC FAMILY':
+                axis = self.canvas.fig.add_subplot(3,3,idx+1)
+            else:
+                axis = self.canvas.fig.add_subplot(2,int(np.ceil(len(features)/2)),idx+1)
+            data = []
+            datepoints = []
+            for patient in patient_ids:
+                datapoints = series['values'][feature][patient]
+                dates = series['dates'][patient]
+                l, = axis.plot(dates, datapoints, ls=':', marker = 'o', linewidth=2.5)
+                if len(datapoints)>0:
+                    l.set_label(patient)
+                    data.append(datapoints)
+                    datepoints.append(dates)
+                else:
+                    warning_list.append(patient)
+            
+            try:
+                unique_dates = np.unique(np.hstack(datepoints))
+                min_value = np.min(np.hstack(data))
+                max_value = np.max(np.hstack(data))
+                axis.set_ylim(min_value-1, max_value+2)
+                axis.set_xlim(-0.5, len(unique_dates)-0.5)
+            except:
+                pass
+            axis.set_xlabel('Date')
+            axis.set_ylabel(feature)
+            axis.legend()
+
+        warning_list = np.unique(warning_list).tolist()
+        self.show_warning_message(warning_list, selected_test)
+        self.canvas.fig.autofmt_xdate()
+        self.canvas.fig.suptitle(t = selected_feature + " Time-series", fontsize = 24)
+        self.canvas.draw()
+        
+        self.canvas.setVisible(True)
+        self.toolbar.setVisible(True)
+
+    def show_sel_dataframe(self):
+        patient_ids = [patient.split(' ')[-1] for patient in self.selected_ids]
+        selected_feature = self.get_checkedItem(self.feature_buttonGroup)
+        selected_test = self.get_checkedItem(self.test_buttonGroup)
+        patient_df = self.with_metadata(self.select_samples(patient_ids, selected_test))
+        
+        self.selected_frame = patient_df
+        self.table_window = TableWindow(self.selected_frame)
+        self.table_window.show()
+    
+    def show_all_dataframe(self):
+        dataframe = self.dataframe if self.dataframe is not None else load_dataset(self.filename, columns=self.columns)
+        self.table_window = TableWindow(self.with_metadata(dataframe))
+        self.table_window.show()
+
+    def import_data(self):
+        file, _ = QtWidgets.QFileDialog.getOpenFileName(self,"Select a file",
+                                                        os.path.dirname(os.path.abspath(__file__)),
+                                                        "Comma-separated values (*.csv *.xlsx)")
+        
+        if file != '':
+            #A second sheet updates the loaded metadata unless the user chooses to replace it
+            replace = False
+            if self.metadata is not None:
+                answer = QtWidgets.QMessageBox.question(self, 'Import Metadata', 'Replace the metadata already imported?\n'
+                                                        '(No adds the new animals and columns to it)',
+                                                        QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No, QtWidgets.QMessageBox.No)
+                replace = answer == QtWidgets.QMessageBox.Yes
+            self.metadata = update_metadata(self.metadata, read_metadata(file), replace)
+            self.plot_cache.clear()
+
+            self.global_radio.setEnabled(True)
+            self.time_radio.setEnabled(True)
+            self.stat_button.setEnabled(True)
+            self.meta_label.setEnabled(True)
+            self.meta_groupbox.setEnabled(True)
+            self.selectMeta_button.setEnabled(True)
+    
+    def export_selection(self):
+            
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save as', os.path.dirname(os.path.abspath(__file__)), "Comma-separated values (*.csv)")
+        
+        if filename != '':
+            patient_ids = [patient.split(' ')[-1] for patient in self.selected_ids]
+            selected_feature = self.get_checkedItem(self.feature_buttonGroup)
+            selected_test = self.get_checkedItem(self.test_buttonGroup)
+            patient_df = self.with_metadata(self.select_samples(patient_ids, selected_test))
+            patient_df.to_csv(filename, index=False)        
+
+    def export_dataset(self):
+
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save as', os.path.dirname(os.path.abspath(__file__)), "Comma-separated values (*.csv)")
+
+        if filename != '':
+            load_dataset(self.filename).to_csv(filename, index=False)
+        
+    
+    #The slot declares no arguments, the button's checked flag is not passed to the wrapper
+    @QtCore.pyqtSlot()
+    @profiled('scatter plot')
+    def generate_boxplot(self):
+
+        self.build_canvas()
+        self.toolbar.setVisible(True)
+        self.canvas.setVisible(True)
+        
+        selected_feature = self.get_checkedItem(self.feature_buttonGroup)
+        selected_test = self.get_checkedItem(self.test_buttonGroup)
+        filters = self.selected_fields
+
+        by_date = self.time_radio.isChecked()
+        features = family_dict[selected_feature] #self.get_checkedItem(self.feature_buttonGroup)
+        features = [feature+'_Value' for feature in features]
+
+        key = ('boxplot', selected_test, tuple(filters), selected_feature, by_date)
+        prepared = self.plot_cache.get(key)
+        if prepared is None:
+            with span('group statistics', fields=len(filters)) as counts:
+                meta_patients = self.metadata.index.tolist()
+            
+                selected_df = join_metadata(self.select_samples(meta_patients, selected_test), self.metadata)
+                counts['rows'] = len(selected_df)
+
+                if len(filters)>1:
+                    column = '-'.join(filters)
+                    #A sample missing any of the fields has no group, astype(str) would make it 'nan'
+                    selected_df = selected_df.dropna(subset=filters).copy()
+                    selected_df[column] = selected_df[filters].astype(str).agg('_'.join, axis=1)
+                else:
+                    column = filters[0]
+                #Samples without a value for the field are left out of every group
+                uniques = selected_df[column].dropna().unique()
+                prepared = self.plot_cache.put(key, (uniques, group_statistics(selected_df, column, uniques, features, by_date)))
+        uniques, stats = prepared
+
+        import matplotlib.patches as mpatches
+        self.canvas.fig.clf()
+        self.canvas.axs = []
+        axis = None
+
+        group_colors = [colors[idx % len(colors)] for idx in range(len(uniques))]
+        patches = [mpatches.Patch(color=group_colors[idx], label = uniques[idx]) for idx in range(len(uniques))]
+        if self.global_radio.isChecked() or by_date:
+            print('Time-based' if by_date else 'Global')
+            point_colors = [group_colors[group] for group in stats['point_group']]
+            for idx, feature in enumerate(features):
+                if selected_feature =='WBC FAMILY':
+                    axis = self.canvas.fig.add_subplot(3,3,idx+1)
+                else:
+                    axis = self.canvas.fig.add_subplot(2,int(np.ceil(len(features)/2)),idx+1)
+
+                values = stats['values'][:, idx]
+                axis.scatter(stats['point_x'], values, alpha=1.0, c=point_colors)
+                for group, color in enumerate(group_colors):
+                    cells = stats['cell_group'] == group
+                    axis.errorbar(stats['cell_x'][cells], stats['means'][cells, idx], yerr=stats['stds'][cells, idx], c=color,
+                                  marker='*', markersize= 9, linestyle='none',capsize=5, capthick=2, alpha=0.3)
+                axis.tick_params(axis='x', which='both', bottom=False, top=False, labelbottom=True)
+                axis.set_xticks(stats['ticks'], stats['labels'])
+                axis.set_xlim(*stats['xlim'])
+                if np.isfinite(values).any():
+                    axis.set_ylim(max(0,np.nanmin(values)-1.5), np.nanmax(values)+1.5)
+                axis.set_ylabel(feature)
+            if by_date:
+                self.canvas.fig.autofmt_xdate()#Comment if plotting fails
+        else:
+            pass
+        self.canvas.fig.legend(handles=patches, loc='upper left')
+        #self.canvas.fig.suptitle(family[0]+' & METADATA')
+        self.canvas.draw()
+        #self.resize(1620, 980)
+        current_size = self.size()
+        
+        if current_size.width() < self.desired_size[0] or current_size.height() < self.desired_size[1]:
+            self.resize(*self.desired_size)
+
+    def reset_window(self):
+        #self.initiate_idBox(self.unique_ids)   
+        self.selected_ids = []
+        self.resize(360, 980)
+        if self.canvas is not None:
+            self.canvas.fig.clf()
+            self.toolbar.hide()
+            self.canvas.draw()
+            self.canvas.hide()
@@ -0,0 +1,154 @@
+#Watch-folder ingest ---> runs next to the analyser and appends its results to the datasets as
+#they arrive, instead of re-exporting the whole directory once in a while. The directory (with
+#--recursive also its subfolders) is polled: a folder is listed again only when its mtime
+#changed, so a poll costs one stat per folder plus one per file still being written, and every
+#--rescan seconds everything is listed again. A new or changed xml is ingested once its size
+#and mtime stayed the same for --settle seconds (files are written in several steps), through
+#export_files like generate_csv.py, so the datasets, manifest and histograms are the same.
+#   python watch_folder.py D:/analyser/results exports/study.csv --recursive
+#--once ingests what is in the directory and exits (e.g. from a scheduled task).
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+from ingest import export_files
+from generate_csv import print_summary
+
+class FolderWatcher:
+    def __init__(self, directory, output, settle=2.0, recursive=False, workers=1, rescan=60.0):
+        self.directory = os.path.abspath(directory)
+        self.output = os.path.abspath(output)
+        self.settle = settle
+        self.recursive = recursive
+        self.workers = workers
+        self.rescan = rescan
+        self.folders = dict()     #folder ---> (mtime when listed, its subfolders)
+        self.candidates = dict()  #xml not ingested yet ---> (size, mtime, since when unchanged)
+        self.known = dict()       #xml ingested (or failed) ---> (size, mtime) at that time
+        self.last_rescan = None
+
+    def check(self, path, stat, now):
+        state = (stat.st_size, stat.st_mtime)
+        if self.known.get(path) == state:
+            self.candidates.pop(path, None)
+            return
+        previous = self.candidates.get(path)
+        if previous is None or previous[:2] != state:
+            self.candidates[path] = state+(now,)
+
+    #Lists the files of folder, returns its subfolders
+    def list_folder(self, folder, now):
+        subfolders = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subfolders.append(entry.path)
+                elif entry.name.lower().endswith('.xml'):
+                    self.check(entry.path, entry.stat(), now)
+        return subfolders
+
+    def scan(self, now):
+        full = self.last_rescan is None or now-self.last_rescan >= self.rescan
+        if full:
+            self.last_rescan = now
+        folders, seen = [self.directory], set()
+        while folders:
+            folder = folders.pop()
+            seen.add(folder)
+            try:
+                mtime = os.stat(folder).st_mtime
+                listed = self.folders.get(folder)
+                if full or listed is None or listed[0] != mtime:
+                    listed = (mtime, self.list_folder(folder, now))
+                    self.folders[folder] = listed
+            except OSError:
+                continue
+            if self.recursive:
+                folders.extend(listed[1])
+        for folder in set(self.folders)-seen:
+            del self.folders[folder]
+        #Files still being written change without touching their folder's mtime
+        for path in list(self.candidates):
+            try:
+                self.check(path, os.stat(path), now)
+            except OSError:
+                del self.candidates[path]
+
+    def ready(self, now):
+        return sorted(path for path, (_, _, since) in self.candidates.items() if now-since >= self.settle)
+
+    #Ingests the settled files, returns the summary of export_files (None without new files)
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.scan(now)
+        filenames = self.ready(now)
+        if not filenames:
+            return None
+        summary = dict()
+        try:
+            export_files(filenames, self.output, workers=self.workers, summary=summary)
+        except Exception as error:
+            #One unreadable file must not hold back the others ---> one at a time, the failed
+            #ones are tried again once they change
+            print('Failed: {}: {}, ingesting the {} files one by one'.format(type(error).__name__, error, len(filenames)), file=sys.stderr)
+            summary = {'files': 0, 'pending': 0, 'rows': 0, 'clean_rows': 0, 'duplicates': 0, 'failed': []}
+            for filename in filenames:
+                file_summary = dict()
+                try:
+                    export_files([filename], self.output, workers=1, summary=file_summary)
+                except Exception as error:
+                    print('Failed: {}: {}: {}'.format(filename, type(error).__name__, error), file=sys.stderr)
+                    summary['failed'].append(filename)
+                for key in ['files', 'pending', 'rows', 'clean_rows', 'duplicates']:
+                    summary[key] += file_summary.get(key, 0)
+        for filename in filenames:
+            self.known[filename] = self.candidates.pop(filename)[:2]
+        return summary
+
+    def run(self, interval=1.0, stop=None):
+        stop = threading.Event() if stop is None else stop
+        while not stop.is_set():
+            start = time.monotonic()
+            summary = self.poll(start)
+            if summary is not None and summary.get('pending'):
+                print(time.strftime('%Y-%m-%d %H:%M:%S'), self.directory)
+                print_summary(summary)
+                sys.stdout.flush()
+            stop.wait(max(0.0, interval-(time.monotonic()-start)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append the analyser xml files to the per-owner datasets as they arrive')
+    parser.add_argument('directory', help='directory the analyser writes its xml files to')
+    parser.add_argument('output', help='output dataset name (.csv, .parquet or .sqlite)')
+    parser.add_argument('--recursive', action='store_true', help='also watch the subfolders')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between polls')
+    parser.add_argument('--settle', type=float, default=2.0, help='seconds a file must stay unchanged before it is ingested')
+    parser.add_argument('--rescan', type=float, default=60.0, help='seconds between full listings of the folders')
+    parser.add_argument('--workers', type=int, default=1, help='parsing processes (0 for all cores)')
+    parser.add_argument('--once', action='store_true', help='ingest the files already there and exit')
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        print('Not a directory:', args.directory, file=sys.stderr)
+        return 2
+
+    watcher = FolderWatcher(args.directory, args.output, args.settle, args.recursive, args.workers or None, args.rescan)
+    if args.once:
+        #Two listings settle seconds apart, files still being written are left for the next run
+        watcher.scan(time.monotonic())
+        time.sleep(args.settle)
+        summary = watcher.poll()
+        print_summary(summary or dict())
+        return 1 if summary and summary.get('failed') else 0
+
+    stop = threading.Event()
+    for name in ['SIGINT', 'SIGTERM', 'SIGBREAK']:
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda *_: stop.set())
+    print('Watching', watcher.directory, '--->', watcher.output)
+    watcher.run(args.interval, stop)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#Qt side of the ingest pipeline, shared by the welcome window and the viewer
+from PyQt5 import QtCore
+from ingest import IngestCancelled
+
+#Runs one of the ingest functions in a QThread. It acts as their progress bar, forwarding
+#setMaximum/setValue as signals, and raises IngestCancelled from setValue once cancelled.
+class IngestWorker(QtCore.QObject):
+    maximum = QtCore.pyqtSignal(int)
+    progress = QtCore.pyqtSignal(int)
+    done = QtCore.pyqtSignal(object)
+    stopped = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, task, *args):
+        super().__init__()
+        self.task = task
+        self.args = args
+        self.cancelled = False
+        self.thread = None
+
+    def setMaximum(self, value):
+        self.maximum.emit(value)
+
+    def setValue(self, value):
+        self.progress.emit(value)
+        if self.cancelled:
+            raise IngestCancelled()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            result = self.task(*self.args, progress=self)
+        except IngestCancelled:
+            self.stopped.emit()
+        except Exception as error:
+            self.failed.emit(str(error))
+        else:
+            self.done.emit(result)
+        self.thread.quit()
+
+    def start(self):
+        self.thread = QtCore.QThread()
+        self.moveToThread(self.thread)
+        self.thread.started.connect(self.run)
+        self.thread.start()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.isRunning()
+
+    #Blocks until the pipeline reached a checkpoint (or finished writing)
+    def stop(self):
+        if self.is_running():
+            self.cancel()
+            self.thread.wait()
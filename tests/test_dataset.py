@@ -0,0 +1,51 @@
+import pytest
+import pandas as pd
+from dataset import load_dataset, save_dataset
+from manifest import drop_samples
+
+
+def test_csv_round_trip_keeps_zero_padded_text(tmp_path):
+    filename = str(tmp_path/'study.csv')
+    pd.DataFrame({'FIELD_SID_SAMPLE_ID': ['007', '12'],
+                  'FIELD_SID_PATIENT_ID': ['0012', '3'],
+                  'ANALYSIS_DATE': ['2023/01/05 10:00:00', '2023/01/06 11:30:00'],
+                  'PLT_THRESHOLDS_SampleThresholds': ['072', 'NA'],
+                  'HCT_Value': ['41.5', '']}).to_csv(filename, index=False)
+
+    dataframe = load_dataset(filename)
+    assert dataframe['FIELD_SID_SAMPLE_ID'].tolist() == ['007', '12']
+    assert dataframe['FIELD_SID_PATIENT_ID'].astype(str).tolist() == ['0012', '3']
+    assert dataframe['PLT_THRESHOLDS_SampleThresholds'].tolist() == ['072', 'NA']
+    assert pd.isna(dataframe['HCT_Value'][1])
+
+    #Stale rows are matched by the manifest key as written by the analyser
+    assert drop_samples(dataframe, {('007', '2023/01/05 10:00:00')})['FIELD_SID_SAMPLE_ID'].tolist() == ['12']
+
+    copy = str(tmp_path/'copy.csv')
+    save_dataset(dataframe, copy)
+    assert load_dataset(copy)['PLT_THRESHOLDS_SampleThresholds'].tolist() == ['072', 'NA']
+
+
+def values(column):
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+#Empty text comes back missing from every format
+def test_blank_text_round_trips_as_missing_in_every_format(tmp_path):
+    pytest.importorskip('pyarrow')
+    dataframe = pd.DataFrame({'FIELD_SID_SAMPLE_ID': ['1', '2'],
+                              'FIELD_SID_PATIENT_ID': ['10', '11'],
+                              'FIELD_SID_ANIMAL_NAME': ['Mouse', ''],
+                              'ANALYSIS_DATE': ['2023/01/05 10:00:00', '2023/01/06 11:30:00'],
+                              'FIELD_SID_OWNER': ['', 'LAB'],
+                              'PLT_THRESHOLDS_SampleThresholds': ['', '072'],
+                              'HCT_Value': ['41.5', '']})
+    loaded = dict()
+    for extension in ('csv', 'parquet', 'sqlite'):
+        filename = str(tmp_path/('study.'+extension))
+        save_dataset(dataframe, filename)
+        loaded[extension] = load_dataset(filename)[dataframe.columns]
+    for extension in ('parquet', 'sqlite'):
+        for column in dataframe.columns:
+            assert values(loaded[extension][column]) == values(loaded['csv'][column]), (extension, column)
+    assert loaded['parquet']['PLT_THRESHOLDS_SampleThresholds'].isna().tolist() == [True, False]
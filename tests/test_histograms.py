@@ -0,0 +1,16 @@
+import logging
+
+import numpy as np
+
+from histograms import decode_histograms
+
+
+#A histogram with a bin out of range, negative or not an integer is stored empty and the rest
+#of the batch is decoded
+def test_invalid_bins_leave_the_batch_decoded(caplog):
+    values = ['1;2;3;', '1;70000;3;', '4;-1;', '1.5;2;', 'a;b;', None, '5;6;7;8;']
+    with caplog.at_level(logging.WARNING, logger='histograms'):
+        out = decode_histograms(values)
+    assert out.dtype == np.uint16
+    assert out.tolist() == [[1, 2, 3, 0], [0]*4, [0]*4, [0]*4, [0]*4, [0]*4, [5, 6, 7, 8]]
+    assert '4 histogram(s) with invalid bins' in caplog.text
@@ -0,0 +1,128 @@
+import os
+import re
+import shutil
+
+import pytest
+
+import ingest
+from synthetic_corpus import generate_corpus
+from ingest import export_files, export_files_chunked, append_files
+from dataset import load_dataset
+from sample_keys import open_keys
+
+
+def sample_ids(output):
+    return sorted(load_dataset(output)['FIELD_SID_SAMPLE_ID'].tolist())
+
+
+#Rewrites filename with edit applied to its text, with a later mtime so the change is seen
+#even when the size stays the same
+def edit_file(filename, edit):
+    with open(filename) as fh:
+        text = fh.read()
+    with open(filename, 'w') as fh:
+        fh.write(edit(text))
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns+10**9))
+
+
+#An unchanged file is skipped by the manifest, and without the manifest its sample is
+#recognised by its key and not added again
+def test_reingesting_an_unchanged_file_adds_nothing(tmp_path):
+    [filename] = generate_corpus(str(tmp_path/'results'), 1)
+    output = str(tmp_path/'study.csv')
+    append_files([filename], output, workers=1)
+
+    summary = dict()
+    new_df, stale = append_files([filename], output, workers=1, summary=summary)
+    assert summary['pending'] == 0
+    assert new_df is None and not stale
+
+    os.remove(str(tmp_path/'study_manifest.json'))
+    summary = dict()
+    new_df, stale = append_files([filename], output, workers=1, summary=summary)
+    assert summary['pending'] == 1 and summary['duplicates'] == 1
+    assert len(new_df) == 0
+    assert sample_ids(output) == ['AUTOSID000']
+
+
+#The same sample exported again in another result folder, under another name and not byte
+#for byte the same, is skipped
+def test_duplicate_sample_in_another_file_is_skipped(tmp_path):
+    [filename] = generate_corpus(str(tmp_path/'results'), 1)
+    output = str(tmp_path/'study.csv')
+    append_files([filename], output, workers=1)
+
+    os.makedirs(str(tmp_path/'later'))
+    export = str(tmp_path/'later'/'export.xml')
+    shutil.copy(filename, export)
+    edit_file(export, lambda text: text+'\n')
+    summary = dict()
+    new_df, stale = append_files([export], output, workers=1, summary=summary)
+    assert summary['pending'] == 1 and summary['duplicates'] == 1
+    assert len(new_df) == 0 and not stale
+    assert sample_ids(output) == ['AUTOSID000']
+    assert len(open_keys(output).keys) == 1
+
+
+#A file modified after ingest replaces its row, it is neither kept twice nor lost
+def test_modified_file_replaces_its_rows(tmp_path):
+    first, second = generate_corpus(str(tmp_path/'results'), 2)
+    output = str(tmp_path/'study.csv')
+    append_files([first, second], output, workers=1)
+
+    edit_file(first, lambda text: re.sub(r'(<st n="Id">HCT</st>.*?<d n="Value">)[^<]*', r'\g<1>99.9', text, count=1, flags=re.S))
+    summary = dict()
+    new_df, stale = append_files([first, second], output, workers=1, summary=summary)
+    assert summary['pending'] == 1 and summary['duplicates'] == 0
+    assert len(new_df) == 1 and len(stale) == 1
+    dataset = load_dataset(output).set_index('FIELD_SID_SAMPLE_ID')
+    assert sorted(dataset.index) == ['AUTOSID000', 'AUTOSID001']
+    assert dataset.loc['AUTOSID000', 'HCT_Value'] == pytest.approx(99.9)
+    assert len(open_keys(output).keys) == 2
+
+
+#A copy of a file already ingested is recorded without rows, editing it later adds its sample
+#and leaves the original's one in place
+def test_edited_copy_does_not_replace_the_original(tmp_path):
+    [original] = generate_corpus(str(tmp_path/'results'), 1)
+    output = str(tmp_path/'study.csv')
+    append_files([original], output, workers=1)
+    assert len(sample_ids(output)) == 1
+
+    copy = str(tmp_path/'results'/'copy.xml')
+    shutil.copy(original, copy)
+    summary = dict()
+    append_files([original, copy], output, workers=1, summary=summary)
+    assert summary['pending'] == 0
+
+    with open(copy) as fh:
+        text = fh.read()
+    with open(copy, 'w') as fh:
+        fh.write(text.replace('AUTOSID000', 'AUTOSID999'))
+    append_files([original, copy], output, workers=1)
+    assert sample_ids(output) == ['AUTOSID000', 'AUTOSID999']
+
+
+#Both export modes write into an output folder that does not exist yet
+def test_exports_make_the_output_folder(tmp_path):
+    files = generate_corpus(str(tmp_path/'results'), 4)
+    for export, folder in ((export_files, 'whole'), (export_files_chunked, 'chunked')):
+        output = str(tmp_path/folder/'study.csv')
+        export(files, output, workers=1)
+        assert os.path.exists(str(tmp_path/folder/'study_manifest.json'))
+        assert not [name for name in os.listdir(str(tmp_path/folder)) if name.startswith('bas_chunks_')]
+
+
+#The chunk spool is removed when the export fails half way
+def test_chunked_export_removes_its_spool_on_failure(tmp_path, monkeypatch):
+    files = generate_corpus(str(tmp_path/'results'), 4)
+    spool_dir = str(tmp_path/'spool')
+    os.makedirs(spool_dir)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(ingest, 'write_owners', fail)
+    with pytest.raises(RuntimeError):
+        export_files_chunked(files, str(tmp_path/'study.csv'), workers=1, spool_dir=spool_dir)
+    assert os.listdir(spool_dir) == []
@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+from series import group_statistics
+
+
+def test_blank_metadata_value_does_not_shift_groups():
+    dataframe = pd.DataFrame({'Group': [np.nan, 'A', 'B', 'A'],
+                              'HCT_Value': [10.0, 1.0, 5.0, 3.0],
+                              'ANALYSIS_DATE': pd.to_datetime(['2023-01-01']*4)})
+    stats = group_statistics(dataframe, 'Group', dataframe['Group'].unique(), ['HCT_Value'])
+
+    assert list(stats['labels']) == ['A', 'B']
+    assert list(stats['ticks']) == [0, 1]
+    #The A points sit under the A tick, the blank sample is in no group
+    assert stats['point_x'].tolist() == [0.0, 1.0, 0.0]
+    assert stats['values'][:, 0].tolist() == [1.0, 5.0, 3.0]
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def test_selection_window_takes_metadata_columns(app):
+    from viewer import SimpleSelectionWindow
+    metadata = pd.DataFrame({'Group': ['A'], 'Treatment': ['B']}, index=pd.Index(['1021'], name='FIELD_SID_PATIENT_ID'))
+    window = SimpleSelectionWindow(parent=None, items=list(metadata.columns), sel=[], label='Metadata Fields')
+    assert window.items == ['Group', 'Treatment']
+
+    window.initial_list_widget.setCurrentRow(0)
+    window.select_item()
+    assert window.selected_items == ['Group']
+    assert window.items == ['Treatment']
+
+
+def test_selection_window_takes_patient_ids(app):
+    from viewer import SimpleSelectionWindow
+    window = SimpleSelectionWindow(parent=None, items=np.array(['1021', '1022']), sel=['1022'], label='IDs')
+    assert window.items == ['1021']
@@ -0,0 +1,17 @@
+from synthetic_corpus import generate_corpus
+from watch_folder import FolderWatcher
+from manifest import load_manifest
+
+
+def test_file_with_only_failed_measurements_is_ingested(tmp_path):
+    [filename] = generate_corpus(str(tmp_path/'results'), 1, invalid_rate=1.0)
+    output = str(tmp_path/'study.csv')
+    watcher = FolderWatcher(str(tmp_path/'results'), output, settle=0.0)
+
+    summary = watcher.poll(0.0)
+    assert summary['pending'] == 1
+    assert not summary.get('failed')
+    assert summary['clean_rows'] == 0
+    #Recorded without an output, so it is neither retried nor parsed again
+    assert load_manifest(output)['files'][filename]['output'] is None
+    assert watcher.poll(1.0) is None